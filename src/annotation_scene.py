@@ -1,13 +1,32 @@
 """Annotation scene for displaying images and bounding boxes"""
-from PySide6.QtCore import Qt, QRectF, QPointF, Signal
-from PySide6.QtGui import QPixmap, QPen, QBrush, QColor
+import math
+from PySide6.QtCore import Qt, QRectF, QPointF, Signal, QObject, QRunnable, QThreadPool, QSignalBlocker
+from PySide6.QtGui import QPixmap, QPen, QBrush, QColor, QImage, QImageReader
 from PySide6.QtWidgets import QGraphicsScene, QGraphicsPixmapItem, QGraphicsRectItem
-from typing import List, Optional
-from .models import ImageData, Annotation
+from typing import Dict, List, Optional
+from .models import ImageData, Annotation, clamp_box
 from .bounding_box_item import BoundingBoxItem
 from .project_manager import ProjectManager
 
 
+class _ImageLoaderSignals(QObject):
+    """Signals emitted by _ImageLoader"""
+    loaded = Signal(int, QImage)  # Emits load token, decoded image
+
+
+class _ImageLoader(QRunnable):
+    """Decodes an image file on a worker thread"""
+    
+    def __init__(self, token: int, filepath: str):
+        super().__init__()
+        self.token = token
+        self.filepath = filepath
+        self.signals = _ImageLoaderSignals()
+        
+    def run(self):
+        self.signals.loaded.emit(self.token, QImage(self.filepath))
+
+
 class AnnotationScene(QGraphicsScene):
     """Custom scene for image and annotation display"""
     
@@ -15,38 +34,66 @@ class AnnotationScene(QGraphicsScene):
     box_selected = Signal(object)  # Emits Annotation
     boxes_selected = Signal(list)  # Emits list of Annotations
     box_created = Signal(object)  # Emits Annotation
+    box_changed = Signal(object)  # Emits Annotation after a move/resize
+    image_load_failed = Signal(str)  # Emits the path of an image that could not be read
     
     def __init__(self, project_manager: ProjectManager, parent=None):
         super().__init__(parent)
         self.project_manager = project_manager
         self.image_item: Optional[QGraphicsPixmapItem] = None
+        # Image bounds from its header; known before the pixels are decoded
+        self.image_rect: Optional[QRectF] = None
         self.box_items: List[BoundingBoxItem] = []
+        # id(annotation) -> box item, kept in step with box_items
+        self._ann_to_item: Dict[int, BoundingBoxItem] = {}
         self.current_image_data: Optional[ImageData] = None
         
+        # Image decodes still running, by load token; kept referenced until they report back
+        self._pending_loaders: Dict[int, _ImageLoader] = {}
+        self._image_load_token = 0
+        
+        # BSP tree depth last set; changing it rebuilds the whole index
+        self._bsp_depth: Optional[int] = None
+        
         # Drawing state
         self.is_drawing = False
         self.draw_start_pos: Optional[QPointF] = None
-        self.draw_rect_item: Optional[QGraphicsRectItem] = None
+        # Rubber band shown while drawing; created once and only shown/hidden afterwards
+        self.draw_rect_item = QGraphicsRectItem()
+        self.draw_rect_item.setPen(QPen(QColor(255, 0, 0), 2, Qt.DashLine))
+        self.draw_rect_item.setBrush(QBrush(Qt.NoBrush))
+        self.draw_rect_item.setZValue(2)
+        self.draw_rect_item.setVisible(False)
+        self.addItem(self.draw_rect_item)
         
     def load_image(self, image_data: ImageData):
         """Load an image into the scene"""
         self.clear_scene()
         self.current_image_data = image_data
         
-        # Load image
-        pixmap = QPixmap(image_data.filepath)
-        if pixmap.isNull():
+        # Read the image size from its header; pixels are decoded off the GUI thread
+        size = QImageReader(image_data.filepath).size()
+        if not size.isValid():
+            self.image_load_failed.emit(image_data.filepath)
             return False
             
-        self.image_item = QGraphicsPixmapItem(pixmap)
+        self.image_item = QGraphicsPixmapItem()
         # Set image z-value to 0 (background)
         self.image_item.setZValue(0)
         self.addItem(self.image_item)
-        self.setSceneRect(self.image_item.boundingRect())
+        self.image_rect = QRectF(0, 0, size.width(), size.height())
+        self.setSceneRect(self.image_rect)
+        
+        self._image_load_token += 1
+        loader = _ImageLoader(self._image_load_token, image_data.filepath)
+        loader.signals.loaded.connect(self._on_image_loaded)
+        self._pending_loaders[loader.token] = loader
+        QThreadPool.globalInstance().start(loader)
         
         # Load annotations
         for annotation in image_data.annotations:
-            self.add_box_item(annotation)
+            self.add_box_item(annotation, defer_update=True)
+        self._tune_item_index()
 
         # Force update
         self.update()
@@ -54,52 +101,101 @@ class AnnotationScene(QGraphicsScene):
             view.viewport().update()
         return True
         
+    def _on_image_loaded(self, token: int, image: QImage):
+        """Show a decoded image unless another image was loaded since"""
+        self._pending_loaders.pop(token, None)
+        if token != self._image_load_token or not self.image_item:
+            return
+        if image.isNull():
+            # The header was readable but the pixels are not; don't keep an empty image item
+            self.removeItem(self.image_item)
+            self.image_item = None
+            if self.current_image_data:
+                self.image_load_failed.emit(self.current_image_data.filepath)
+            return
+        self.image_item.setPixmap(QPixmap.fromImage(image))
+        
     def clear_scene(self):
         """Clear all items from scene"""
         self.box_items.clear()
+        self._ann_to_item.clear()
         self.image_item = None
+        self.image_rect = None
         self.current_image_data = None
+        # Keep the rubber band alive across clear(), which deletes every item in the scene
+        self.removeItem(self.draw_rect_item)
         self.clear()
+        self.addItem(self.draw_rect_item)
         
-    def add_box_item(self, annotation: Annotation):
-        """Add a bounding box item"""
+    def add_box_item(self, annotation: Annotation, defer_update: bool = False):
+        """Add a bounding box item
+
+        With defer_update the caller is responsible for refreshing the scene
+        and views once after adding a batch of boxes.
+        """
         # Get class color
-        color = "#FF0000"
-        if self.project_manager.project:
-            for cls in self.project_manager.project.classes:
-                if cls.id == annotation.class_id:
-                    color = cls.color
-                    break
+        color = self.project_manager.class_color_for(annotation.class_id) or "#FF0000"
         box_item = BoundingBoxItem(annotation, class_color=color, 
                                    on_changed=self._on_box_changed)
         self.addItem(box_item)
         self.box_items.append(box_item)
+        self._ann_to_item[id(annotation)] = box_item
         
         # Ensure box is above image (z-order)
         if self.image_item:
             box_item.setZValue(self.image_item.zValue() + 1)
         
-        # Force update
-        box_item.update()
-        self.update()
-
-        # Update all viewports to render the new box
-        for view in self.views():
-            view.viewport().update()
+        if defer_update:
+            return
+        self._tune_item_index()
+        
+        # Repaint only the area covered by the new box, its label and handles
+        dirty = box_item.mapRectToScene(box_item.boundingRect().united(box_item.childrenBoundingRect()))
+        self.invalidate(dirty.adjusted(-4, -4, 4, 4), QGraphicsScene.ItemLayer)
         
     def remove_box_item(self, box_item: BoundingBoxItem):
         """Remove a bounding box item"""
         if box_item in self.box_items:
             self.box_items.remove(box_item)
+            if self._ann_to_item.get(id(box_item.annotation)) is box_item:
+                del self._ann_to_item[id(box_item.annotation)]
             self.removeItem(box_item)
+            self._tune_item_index()
+            
+    def remove_box_items(self, box_items: List[BoundingBoxItem]):
+        """Remove several bounding box items, re-tuning the item index once"""
+        removed = {id(box_item) for box_item in box_items}
+        to_remove = [box_item for box_item in self.box_items if id(box_item) in removed]
+        if not to_remove:
+            return
+        
+        # The selection changes are not signalled one by one, the caller refreshes once afterwards
+        with QSignalBlocker(self):
+            for box_item in to_remove:
+                if self._ann_to_item.get(id(box_item.annotation)) is box_item:
+                    del self._ann_to_item[id(box_item.annotation)]
+                self.removeItem(box_item)
+        self.box_items = [box_item for box_item in self.box_items if id(box_item) not in removed]
+        self._tune_item_index()
+        self.update()
             
+    def box_item_for(self, annotation: Annotation) -> Optional[BoundingBoxItem]:
+        """Get the box item showing an annotation, if it is on the scene"""
+        return self._ann_to_item.get(id(annotation))
+        
+    def refresh_box_item(self, annotation: Annotation):
+        """Re-read geometry, color and label of the box showing an annotation"""
+        box_item = self._ann_to_item.get(id(annotation))
+        if not box_item:
+            return
+        box_item.update_rect()
+        box_item.set_class_color(self.project_manager.class_color_for(annotation.class_id) or "#FF0000")
+        box_item.set_class_name(annotation.class_name)
+        
     def get_selected_boxes(self) -> List[Annotation]:
         """Get list of selected annotations"""
-        selected = []
-        for box_item in self.box_items:
-            if box_item.isSelected():
-                selected.append(box_item.annotation)
-        return selected
+        return [item.annotation for item in self.selectedItems()
+                if isinstance(item, BoundingBoxItem)]
         
     def select_all_boxes(self):
         """Select all boxes"""
@@ -118,12 +214,9 @@ class AnnotationScene(QGraphicsScene):
         self.is_drawing = True
         self.draw_start_pos = pos
         
-        # Create temporary rectangle
-        self.draw_rect_item = QGraphicsRectItem()
-        pen = QPen(QColor(255, 0, 0), 2, Qt.DashLine)
-        self.draw_rect_item.setPen(pen)
-        self.draw_rect_item.setBrush(QBrush(Qt.NoBrush))
-        self.addItem(self.draw_rect_item)
+        # Show the rubber band
+        self.draw_rect_item.setRect(QRectF(pos, pos))
+        self.draw_rect_item.setVisible(True)
         
     def update_drawing_box(self, pos: QPointF):
         """Update drawing box while dragging"""
@@ -138,21 +231,18 @@ class AnnotationScene(QGraphicsScene):
         if not self.is_drawing or not self.draw_start_pos or not self.current_image_data:
             return None
             
-        # Remove temporary rectangle
-        if self.draw_rect_item:
-            self.removeItem(self.draw_rect_item)
-            self.draw_rect_item = None
+        # Hide the rubber band
+        self._hide_draw_rect()
             
         # Create annotation
         rect = QRectF(self.draw_start_pos, pos).normalized()
         
         # Clamp to image bounds
-        img_width = self.current_image_data.width
-        img_height = self.current_image_data.height
-        x_min = max(0, min(int(rect.x()), img_width - 1))
-        y_min = max(0, min(int(rect.y()), img_height - 1))
-        x_max = max(x_min + 1, min(int(rect.x() + rect.width()), img_width))
-        y_max = max(y_min + 1, min(int(rect.y() + rect.height()), img_height))
+        x_min, y_min, x_max, y_max = clamp_box(
+            int(rect.x()), int(rect.y()),
+            int(rect.x() + rect.width()), int(rect.y() + rect.height()),
+            self.current_image_data.width, self.current_image_data.height
+        )
         
         if x_max <= x_min or y_max <= y_min:
             self.is_drawing = False
@@ -174,17 +264,13 @@ class AnnotationScene(QGraphicsScene):
             y_max=y_max
         )
         
-        # Add to image data
-        self.current_image_data.annotations.append(annotation)
-        
-        # Add box item
+        # Add box item; listeners of box_created add the annotation to the image (undoably)
         self.add_box_item(annotation)
         
-        # Force scene update to show the new box
-        self.update()
-        self.invalidate()
-        # Ensure scene rect includes all items
-        self.setSceneRect(self.itemsBoundingRect())
+        # Ensure scene rect includes the new box; it always keeps the image bounds
+        box_item = self._ann_to_item.get(id(annotation))
+        if box_item:
+            self.setSceneRect(self.sceneRect().united(box_item.sceneBoundingRect()))
 
         self.is_drawing = False
         self.box_created.emit(annotation)
@@ -192,11 +278,22 @@ class AnnotationScene(QGraphicsScene):
         
     def cancel_drawing_box(self):
         """Cancel drawing box"""
-        if self.draw_rect_item:
-            self.removeItem(self.draw_rect_item)
-            self.draw_rect_item = None
+        self._hide_draw_rect()
         self.is_drawing = False
         
+    def _hide_draw_rect(self):
+        """Hide the rubber band and drop its geometry"""
+        self.draw_rect_item.setVisible(False)
+        self.draw_rect_item.setRect(QRectF())
+        
+    def _tune_item_index(self):
+        """Use a BSP index sized to the current number of boxes"""
+        depth = max(4, int(math.log2(max(len(self.box_items), 1))) + 2)
+        # Only re-index when the box count crossed into another depth
+        if depth != self._bsp_depth:
+            self._bsp_depth = depth
+            self.setBspTreeDepth(depth)
+        
     def _on_box_changed(self, annotation: Annotation):
         """Handle box change"""
         # Clamp to image bounds
@@ -206,17 +303,18 @@ class AnnotationScene(QGraphicsScene):
                 self.current_image_data.height
             )
             # Update rect to match clamped values
-            for box_item in self.box_items:
-                if box_item.annotation == annotation:
-                    box_item.update_rect()
-                    break
+            box_item = self._ann_to_item.get(id(annotation))
+            if box_item:
+                box_item.update_rect()
+        self.box_changed.emit(annotation)
             
-    def update_box_colors(self):
-        """Update box colors based on class colors"""
+    def update_box_colors(self, class_id: Optional[int] = None):
+        """Update box colors and labels based on their classes, optionally only for one class"""
         if not self.project_manager.project:
             return
-        class_colors = {cls.id: cls.color for cls in self.project_manager.project.classes}
         for box_item in self.box_items:
-            color = class_colors.get(box_item.annotation.class_id, "#FF0000")
+            if class_id is not None and box_item.annotation.class_id != class_id:
+                continue
+            color = self.project_manager.class_color_for(box_item.annotation.class_id) or "#FF0000"
             box_item.set_class_color(color)
-            box_item.update()
+            box_item.set_class_name(box_item.annotation.class_name)
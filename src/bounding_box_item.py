@@ -1,9 +1,84 @@
 """Bounding box graphics item with resize handles"""
 from PySide6.QtCore import Qt, QRectF, QPointF
-from PySide6.QtGui import QPen, QBrush, QColor, QPainter, QCursor
-from PySide6.QtWidgets import QGraphicsRectItem, QGraphicsItem
-from typing import Optional, Callable
-from .models import Annotation
+from PySide6.QtGui import QPen, QBrush, QColor, QPainter, QCursor, QFont, QPixmap, QPixmapCache
+from PySide6.QtWidgets import QGraphicsRectItem, QGraphicsItem, QGraphicsPixmapItem
+from typing import Optional, Callable, Dict, List, Tuple
+from .models import Annotation, utcnow_iso
+
+
+# Drawing styles shared by every box of the same color:
+# color string -> (normal pen, selected pen, label brush)
+_STYLE_CACHE: Dict[str, Tuple[QPen, QPen, QBrush]] = {}
+
+_HANDLE_PEN = QPen(Qt.black, 1)
+_HANDLE_BRUSH = QBrush(Qt.white)
+
+
+def _style_for(color_str: str) -> Tuple[QPen, QPen, QBrush]:
+    """Get the cached pens and brush for a class color, parsing the color only once"""
+    style = _STYLE_CACHE.get(color_str)
+    if style is None:
+        color = QColor(color_str)
+        if not color.isValid():
+            color = QColor("#FF0000")
+        style = (QPen(color, 2), QPen(color, 3, Qt.DashLine), QBrush(color))
+        _STYLE_CACHE[color_str] = style
+    return style
+
+
+_LABEL_WIDTH = 100
+_LABEL_HEIGHT = 18
+# Labels are rendered at twice their scene size so they stay sharp when zoomed in
+_LABEL_PIXMAP_SCALE = 2
+
+
+def _label_pixmap(color_str: str, name: str) -> QPixmap:
+    """Get the label pixmap for a class, rendering it once per (color, name)"""
+    key = f"bbox-label|{color_str}|{name}"
+    pixmap = QPixmapCache.find(key)
+    if pixmap is not None and not pixmap.isNull():
+        return pixmap
+    
+    pixmap = QPixmap(_LABEL_WIDTH * _LABEL_PIXMAP_SCALE, _LABEL_HEIGHT * _LABEL_PIXMAP_SCALE)
+    pixmap.setDevicePixelRatio(_LABEL_PIXMAP_SCALE)
+    pixmap.fill(Qt.transparent)
+    painter = QPainter(pixmap)
+    painter.setPen(QPen(Qt.white))
+    painter.setBrush(_style_for(color_str)[2])
+    painter.drawRect(QRectF(0, 0, _LABEL_WIDTH - 1, _LABEL_HEIGHT - 1))
+    font = QFont()
+    font.setPointSize(10)
+    painter.setFont(font)
+    painter.drawText(QRectF(0, 0, _LABEL_WIDTH, _LABEL_HEIGHT), Qt.AlignCenter, name)
+    painter.end()
+    QPixmapCache.insert(key, pixmap)
+    return pixmap
+
+
+# Edges (left, top, right, bottom) dragged by each resize handle, in _get_handle_positions order
+_HANDLE_EDGES = (
+    (True, True, False, False),  # Top-left
+    (False, True, False, False),  # Top-center
+    (False, True, True, False),  # Top-right
+    (False, False, True, False),  # Right-center
+    (False, False, True, True),  # Bottom-right
+    (False, False, False, True),  # Bottom-center
+    (True, False, False, True),  # Bottom-left
+    (True, False, False, False),  # Left-center
+)
+
+
+def _resize_rect(handle: int, x: float, y: float, w: float, h: float,
+                 new_x: float, new_y: float) -> Tuple[float, float, float, float]:
+    """Return (x, y, w, h) after dragging the given handle to (new_x, new_y)"""
+    if not 0 <= handle < len(_HANDLE_EDGES):
+        return x, y, w, h
+    moves_left, moves_top, moves_right, moves_bottom = _HANDLE_EDGES[handle]
+    left = new_x if moves_left else x
+    top = new_y if moves_top else y
+    right = new_x if moves_right else x + w
+    bottom = new_y if moves_bottom else y + h
+    return left, top, right - left, bottom - top
 
 
 class BoundingBoxItem(QGraphicsRectItem):
@@ -18,11 +93,25 @@ class BoundingBoxItem(QGraphicsRectItem):
         self.annotation = annotation
         self._class_color = class_color
         self._on_changed_callback = on_changed
+        # Set while a drag has changed coordinates that are not yet committed
+        self._annotation_dirty = False
+        
+        # Class label: a child item showing a pixmap shared by all boxes of the class
+        self._label_name = annotation.class_name
+        self._label_item = QGraphicsPixmapItem(self)
+        self._label_item.setAcceptedMouseButtons(Qt.NoButton)
+        self._label_item.setTransformationMode(Qt.SmoothTransformation)
+        
+        self._rebuild_style()
         self.setFlag(QGraphicsItem.ItemIsMovable, True)
         self.setFlag(QGraphicsItem.ItemIsSelectable, True)
         self.setFlag(QGraphicsItem.ItemSendsGeometryChanges, True)
         self.setAcceptHoverEvents(True)
-        self.setFlag(QGraphicsItem.ItemSendsScenePositionChanges, True)
+        # Render box and handles into a cached pixmap; update() invalidates it
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+        
+        # Resize handle rects (corners + edges), rebuilt whenever the rect changes
+        self._handle_rects: List[QRectF] = []
         
         # Set initial rect
         self.update_rect()
@@ -30,16 +119,57 @@ class BoundingBoxItem(QGraphicsRectItem):
         # Ensure it's visible
         self.setVisible(True)
         
-        # Resize handle positions (corners + edges)
-        self.handles = []
         self.active_handle = None
         self.is_resizing = False
         
     def set_class_color(self, color: str):
         """Set class color for this box"""
         self._class_color = color
+        self._rebuild_style()
         self.update()
         
+    def set_class_name(self, name: str):
+        """Update the label text when the annotation's class changes"""
+        if name == self._label_name:
+            return
+        self._label_name = name
+        self._refresh_label()
+        
+    def _rebuild_style(self):
+        """Pick up the shared pens and the label pixmap for the class color"""
+        self._pen_normal, self._pen_selected, _ = _style_for(self._class_color)
+        self._refresh_label()
+        
+    def _refresh_label(self):
+        """Show the cached label pixmap for the current class name and color"""
+        if self._label_name:
+            self._label_item.setPixmap(_label_pixmap(self._class_color, self._label_name))
+        self._label_item.setVisible(bool(self._label_name))
+        
+    def setRect(self, rect: QRectF):
+        """Set the box rect and refresh the cached handle rects and label position"""
+        super().setRect(rect)
+        self._rebuild_handle_rects()
+        self._layout_label()
+        
+    def _layout_label(self):
+        """Place the label just above the box"""
+        rect = self.rect()
+        self._label_item.setPos(rect.x(), max(0, rect.y() - 20))
+        
+    def _rebuild_handle_rects(self):
+        """Recompute the resize handle rects from the current rect"""
+        rect = self.rect()
+        self._handle_rects = [
+            QRectF(
+                handle_pos.x() - self.HANDLE_HALF,
+                handle_pos.y() - self.HANDLE_HALF,
+                self.HANDLE_SIZE,
+                self.HANDLE_SIZE
+            )
+            for handle_pos in self._get_handle_positions(rect)
+        ]
+        
     def update_rect(self):
         """Update rectangle from annotation coordinates"""
         width = self.annotation.x_max - self.annotation.x_min
@@ -59,27 +189,35 @@ class BoundingBoxItem(QGraphicsRectItem):
         self.setRect(rect)
         self.prepareGeometryChange()
         
-    def update_annotation(self):
-        """Update annotation from rectangle"""
-        from datetime import datetime
+    def _sync_coords_to_annotation(self):
+        """Copy the rectangle into the annotation while a drag is in progress"""
         rect = self.rect()
         self.annotation.x_min = int(rect.x())
         self.annotation.y_min = int(rect.y())
         self.annotation.x_max = int(rect.x() + rect.width())
         self.annotation.y_max = int(rect.y() + rect.height())
-        self.annotation.modified_at = datetime.utcnow().isoformat() + "Z"
+        self._annotation_dirty = True
+        
+    def _commit_annotation_change(self):
+        """Finish a move/resize gesture: stamp modified_at and notify once"""
+        if not self._annotation_dirty:
+            return
+        self._annotation_dirty = False
+        self.annotation.modified_at = utcnow_iso()
         # Call callback if provided
         if self._on_changed_callback:
             self._on_changed_callback(self.annotation)
         
+    def boundingRect(self) -> QRectF:
+        """Bounding rect covering the box and its resize handles"""
+        margin = self.HANDLE_HALF + 1
+        return super().boundingRect().adjusted(-margin, -margin, margin, margin)
+        
     def paint(self, painter: QPainter, option, widget=None):
         """Custom paint with selection highlight and handles"""
-        # Get class color - will be set by scene
-        color_str = getattr(self, '_class_color', "#FF0000")
-        try:
-            color = QColor(color_str)
-        except:
-            color = QColor("#FF0000")
+        # Box and handles are axis-aligned; antialiasing only adds raster cost
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, False)
         
         # Ensure we have a valid rect
         rect = self.rect()
@@ -87,25 +225,10 @@ class BoundingBoxItem(QGraphicsRectItem):
             return
         
         # Draw box
-        pen_width = 3 if self.isSelected() else 2
-        pen = QPen(color, pen_width)
-        if self.isSelected():
-            pen.setStyle(Qt.DashLine)
-        painter.setPen(pen)
-        painter.setBrush(QBrush(Qt.NoBrush))
+        painter.setPen(self._pen_selected if self.isSelected() else self._pen_normal)
+        painter.setBrush(Qt.NoBrush)
         painter.drawRect(rect)
         
-        # Draw label
-        if self.annotation.class_name:
-            painter.setPen(QPen(Qt.white))
-            painter.setBrush(QBrush(color))
-            font = painter.font()
-            font.setPointSize(10)
-            painter.setFont(font)
-            label_rect = QRectF(rect.x(), max(0, rect.y() - 20), 100, 18)
-            painter.drawRect(label_rect)
-            painter.drawText(label_rect, Qt.AlignCenter, self.annotation.class_name)
-        
         # Draw resize handles if selected
         if self.isSelected():
             self._draw_handles(painter)
@@ -115,18 +238,11 @@ class BoundingBoxItem(QGraphicsRectItem):
         rect = self.rect()
         if rect.width() <= 0 or rect.height() <= 0:
             return
-        handles = self._get_handle_positions(rect)
         
-        painter.setPen(QPen(Qt.black, 1))
-        painter.setBrush(QBrush(Qt.white))
+        painter.setPen(_HANDLE_PEN)
+        painter.setBrush(_HANDLE_BRUSH)
         
-        for handle_pos in handles:
-            handle_rect = QRectF(
-                handle_pos.x() - self.HANDLE_HALF,
-                handle_pos.y() - self.HANDLE_HALF,
-                self.HANDLE_SIZE,
-                self.HANDLE_SIZE
-            )
+        for handle_rect in self._handle_rects:
             painter.drawRect(handle_rect)
             
     def _get_handle_positions(self, rect: QRectF) -> list:
@@ -147,7 +263,7 @@ class BoundingBoxItem(QGraphicsRectItem):
         """Handle item changes"""
         if change == QGraphicsItem.ItemPositionHasChanged:
             # Update annotation when moved
-            self.update_annotation()
+            self._sync_coords_to_annotation()
         elif change == QGraphicsItem.ItemSelectedHasChanged:
             self.update()
         return super().itemChange(change, value)
@@ -156,17 +272,9 @@ class BoundingBoxItem(QGraphicsRectItem):
         """Handle mouse press for resizing"""
         if event.button() == Qt.LeftButton:
             pos = event.pos()
-            rect = self.rect()
-            handles = self._get_handle_positions(rect)
             
             # Check if clicking on a handle
-            for i, handle_pos in enumerate(handles):
-                handle_rect = QRectF(
-                    handle_pos.x() - self.HANDLE_HALF,
-                    handle_pos.y() - self.HANDLE_HALF,
-                    self.HANDLE_SIZE,
-                    self.HANDLE_SIZE
-                )
+            for i, handle_rect in enumerate(self._handle_rects):
                 if handle_rect.contains(pos):
                     self.active_handle = i
                     self.is_resizing = True
@@ -181,32 +289,15 @@ class BoundingBoxItem(QGraphicsRectItem):
         if self.is_resizing and self.active_handle is not None:
             new_pos = event.pos()
             rect = self.rect()
-            x, y, w, h = rect.x(), rect.y(), rect.width(), rect.height()
-            
-            # Calculate new rect based on handle
-            if self.active_handle == 0:  # Top-left
-                new_rect = QRectF(new_pos.x(), new_pos.y(), w + (x - new_pos.x()), h + (y - new_pos.y()))
-            elif self.active_handle == 1:  # Top-center
-                new_rect = QRectF(x, new_pos.y(), w, h + (y - new_pos.y()))
-            elif self.active_handle == 2:  # Top-right
-                new_rect = QRectF(x, new_pos.y(), new_pos.x() - x, h + (y - new_pos.y()))
-            elif self.active_handle == 3:  # Right-center
-                new_rect = QRectF(x, y, new_pos.x() - x, h)
-            elif self.active_handle == 4:  # Bottom-right
-                new_rect = QRectF(x, y, new_pos.x() - x, new_pos.y() - y)
-            elif self.active_handle == 5:  # Bottom-center
-                new_rect = QRectF(x, y, w, new_pos.y() - y)
-            elif self.active_handle == 6:  # Bottom-left
-                new_rect = QRectF(new_pos.x(), y, w + (x - new_pos.x()), new_pos.y() - y)
-            elif self.active_handle == 7:  # Left-center
-                new_rect = QRectF(new_pos.x(), y, w + (x - new_pos.x()), h)
-            else:
-                new_rect = rect
+            new_rect = QRectF(*_resize_rect(
+                self.active_handle, rect.x(), rect.y(), rect.width(), rect.height(),
+                new_pos.x(), new_pos.y()
+            ))
                 
             # Ensure minimum size
             if new_rect.width() > 10 and new_rect.height() > 10:
                 self.setRect(new_rect)
-                self.update_annotation()
+                self._sync_coords_to_annotation()
             event.accept()
         else:
             super().mouseMoveEvent(event)
@@ -217,22 +308,22 @@ class BoundingBoxItem(QGraphicsRectItem):
             self.is_resizing = False
             self.active_handle = None
             self.setFlag(QGraphicsItem.ItemIsMovable, True)
+            self._commit_annotation_change()
             event.accept()
         else:
             super().mouseReleaseEvent(event)
+            # A drag moves every selected box, but only the grabbed one sees the release
+            self._commit_annotation_change()
+            if self.scene():
+                for item in self.scene().selectedItems():
+                    if isinstance(item, BoundingBoxItem):
+                        item._commit_annotation_change()
             
     def hoverMoveEvent(self, event):
         """Change cursor on handle hover"""
         if self.isSelected():
             pos = event.pos()
-            handles = self._get_handle_positions(self.rect())
-            for handle_pos in handles:
-                handle_rect = QRectF(
-                    handle_pos.x() - self.HANDLE_HALF,
-                    handle_pos.y() - self.HANDLE_HALF,
-                    self.HANDLE_SIZE,
-                    self.HANDLE_SIZE
-                )
+            for handle_rect in self._handle_rects:
                 if handle_rect.contains(pos):
                     self.setCursor(QCursor(Qt.SizeFDiagCursor))
                     return
@@ -1,19 +1,39 @@
 """Command pattern for undo/redo functionality"""
 from abc import ABC, abstractmethod
-from typing import List, Optional
-from .models import Annotation, ImageData
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, List, Optional, Tuple
+from .models import Annotation, ImageData, clamp_box
+
+
+def _index_of(annotations: List[Annotation], annotation: Annotation) -> int:
+    """Return the position of annotation (by identity) in annotations, or -1"""
+    for idx, ann in enumerate(annotations):
+        if ann is annotation:
+            return idx
+    return -1
+
+
+@dataclass
+class SceneDelta:
+    """Boxes added, removed or changed by running or undoing a command"""
+    image_data: Optional[ImageData] = None  # Image whose annotation list changed, if any
+    added: List[Annotation] = field(default_factory=list)
+    removed: List[Annotation] = field(default_factory=list)
+    changed: List[Annotation] = field(default_factory=list)
+    reclassified: List[Tuple[int, int]] = field(default_factory=list)  # (old, new) class id per change
 
 
 class Command(ABC):
     """Base command interface"""
     
     @abstractmethod
-    def execute(self):
+    def execute(self) -> SceneDelta:
         """Execute the command"""
         pass
         
     @abstractmethod
-    def undo(self):
+    def undo(self) -> SceneDelta:
         """Undo the command"""
         pass
 
@@ -25,12 +45,16 @@ class CreateBoxCommand(Command):
         self.image_data = image_data
         self.annotation = annotation
         
-    def execute(self):
+    def execute(self) -> SceneDelta:
         self.image_data.annotations.append(self.annotation)
+        return SceneDelta(self.image_data, added=[self.annotation])
         
-    def undo(self):
-        if self.annotation in self.image_data.annotations:
-            self.image_data.annotations.remove(self.annotation)
+    def undo(self) -> SceneDelta:
+        idx = _index_of(self.image_data.annotations, self.annotation)
+        if idx < 0:
+            return SceneDelta(self.image_data)
+        del self.image_data.annotations[idx]
+        return SceneDelta(self.image_data, removed=[self.annotation])
 
 
 class DeleteBoxCommand(Command):
@@ -41,14 +65,18 @@ class DeleteBoxCommand(Command):
         self.annotation = annotation
         self.index = -1
         
-    def execute(self):
-        if self.annotation in self.image_data.annotations:
-            self.index = self.image_data.annotations.index(self.annotation)
-            self.image_data.annotations.remove(self.annotation)
+    def execute(self) -> SceneDelta:
+        self.index = _index_of(self.image_data.annotations, self.annotation)
+        if self.index < 0:
+            return SceneDelta(self.image_data)
+        del self.image_data.annotations[self.index]
+        return SceneDelta(self.image_data, removed=[self.annotation])
             
-    def undo(self):
-        if 0 <= self.index <= len(self.image_data.annotations):
-            self.image_data.annotations.insert(self.index, self.annotation)
+    def undo(self) -> SceneDelta:
+        if not 0 <= self.index <= len(self.image_data.annotations):
+            return SceneDelta(self.image_data)
+        self.image_data.annotations.insert(self.index, self.annotation)
+        return SceneDelta(self.image_data, added=[self.annotation])
 
 
 class DeleteBoxesCommand(Command):
@@ -59,23 +87,27 @@ class DeleteBoxesCommand(Command):
         self.annotations = annotations
         self.indices = []
         
-    def execute(self):
+    def execute(self) -> SceneDelta:
+        to_remove = {id(ann) for ann in self.annotations}
+        # Single pass: record (index, annotation) for undo and keep the survivors
         self.indices = []
-        for ann in self.annotations:
-            if ann in self.image_data.annotations:
-                idx = self.image_data.annotations.index(ann)
+        survivors = []
+        for idx, ann in enumerate(self.image_data.annotations):
+            if id(ann) in to_remove:
                 self.indices.append((idx, ann))
-        # Sort by index descending to remove from end
-        self.indices.sort(reverse=True)
-        for idx, ann in self.indices:
-            self.image_data.annotations.remove(ann)
+            else:
+                survivors.append(ann)
+        self.image_data.annotations[:] = survivors
+        return SceneDelta(self.image_data, removed=[ann for _, ann in self.indices])
             
-    def undo(self):
-        # Restore in original order
-        self.indices.sort()
+    def undo(self) -> SceneDelta:
+        # Restore in original order; indices were recorded ascending
+        restored = []
         for idx, ann in self.indices:
             if 0 <= idx <= len(self.image_data.annotations):
                 self.image_data.annotations.insert(idx, ann)
+                restored.append(ann)
+        return SceneDelta(self.image_data, added=restored)
 
 
 class MoveBoxCommand(Command):
@@ -87,22 +119,23 @@ class MoveBoxCommand(Command):
         self.dy = dy
         self.img_width = img_width
         self.img_height = img_height
+        self.old_coords = None
         
-    def execute(self):
-        self.annotation.x_min = max(0, min(self.annotation.x_min + self.dx, self.img_width - 1))
-        self.annotation.y_min = max(0, min(self.annotation.y_min + self.dy, self.img_height - 1))
-        self.annotation.x_max = max(self.annotation.x_min + 1, 
-                                   min(self.annotation.x_max + self.dx, self.img_width))
-        self.annotation.y_max = max(self.annotation.y_min + 1,
-                                   min(self.annotation.y_max + self.dy, self.img_height))
+    def execute(self) -> SceneDelta:
+        ann = self.annotation
+        # Remember the exact pre-move box; shifting back would re-clamp a box moved into an edge
+        self.old_coords = (ann.x_min, ann.y_min, ann.x_max, ann.y_max)
+        ann.x_min, ann.y_min, ann.x_max, ann.y_max = clamp_box(
+            ann.x_min + self.dx, ann.y_min + self.dy, ann.x_max + self.dx, ann.y_max + self.dy,
+            self.img_width, self.img_height)
+        return SceneDelta(changed=[ann])
         
-    def undo(self):
-        self.annotation.x_min = max(0, min(self.annotation.x_min - self.dx, self.img_width - 1))
-        self.annotation.y_min = max(0, min(self.annotation.y_min - self.dy, self.img_height - 1))
-        self.annotation.x_max = max(self.annotation.x_min + 1,
-                                   min(self.annotation.x_max - self.dx, self.img_width))
-        self.annotation.y_max = max(self.annotation.y_min + 1,
-                                   min(self.annotation.y_max - self.dy, self.img_height))
+    def undo(self) -> SceneDelta:
+        if self.old_coords is None:
+            return SceneDelta()
+        ann = self.annotation
+        ann.x_min, ann.y_min, ann.x_max, ann.y_max = self.old_coords
+        return SceneDelta(changed=[ann])
 
 
 class ResizeBoxCommand(Command):
@@ -115,22 +148,22 @@ class ResizeBoxCommand(Command):
         self.old_y_min = annotation.y_min
         self.old_x_max = annotation.x_max
         self.old_y_max = annotation.y_max
-        self.new_x_min = max(0, min(x_min, img_width - 1))
-        self.new_y_min = max(0, min(y_min, img_height - 1))
-        self.new_x_max = max(self.new_x_min + 1, min(x_max, img_width))
-        self.new_y_max = max(self.new_y_min + 1, min(y_max, img_height))
+        self.new_x_min, self.new_y_min, self.new_x_max, self.new_y_max = clamp_box(
+            x_min, y_min, x_max, y_max, img_width, img_height)
         
-    def execute(self):
+    def execute(self) -> SceneDelta:
         self.annotation.x_min = self.new_x_min
         self.annotation.y_min = self.new_y_min
         self.annotation.x_max = self.new_x_max
         self.annotation.y_max = self.new_y_max
+        return SceneDelta(changed=[self.annotation])
         
-    def undo(self):
+    def undo(self) -> SceneDelta:
         self.annotation.x_min = self.old_x_min
         self.annotation.y_min = self.old_y_min
         self.annotation.x_max = self.old_x_max
         self.annotation.y_max = self.old_y_max
+        return SceneDelta(changed=[self.annotation])
 
 
 class ChangeClassCommand(Command):
@@ -142,55 +175,59 @@ class ChangeClassCommand(Command):
         self.new_class_name = new_class_name
         self.old_classes = [(ann.class_id, ann.class_name) for ann in annotations]
         
-    def execute(self):
+    def execute(self) -> SceneDelta:
+        reclassified = []
         for ann in self.annotations:
+            reclassified.append((ann.class_id, self.new_class_id))
             ann.class_id = self.new_class_id
             ann.class_name = self.new_class_name
+        return SceneDelta(changed=list(self.annotations), reclassified=reclassified)
             
-    def undo(self):
+    def undo(self) -> SceneDelta:
+        reclassified = []
         for ann, (old_id, old_name) in zip(self.annotations, self.old_classes):
+            reclassified.append((ann.class_id, old_id))
             ann.class_id = old_id
             ann.class_name = old_name
+        return SceneDelta(changed=list(self.annotations), reclassified=reclassified)
 
 
 class CommandHistory:
     """Manages command history for undo/redo"""
     
     def __init__(self, max_history: int = 50):
-        self.history: List[Command] = []
-        self.current_index: int = -1
+        # Undo stack; the oldest command is dropped once max_history is reached
+        self.history: Deque[Command] = deque(maxlen=max_history)
+        self.redo_stack: Deque[Command] = deque()
         self.max_history = max_history
         
-    def execute_command(self, command: Command):
-        """Execute a command and add to history"""
-        command.execute()
-        # Remove any commands after current index (when redo was possible)
-        self.history = self.history[:self.current_index + 1]
-        # Add new command
+    def execute_command(self, command: Command) -> SceneDelta:
+        """Execute a command and add to history; returns what it changed"""
+        delta = command.execute()
         self.history.append(command)
-        self.current_index += 1
-        # Limit history size
-        if len(self.history) > self.max_history:
-            self.history.pop(0)
-            self.current_index -= 1
+        # A new command invalidates anything that could be redone
+        self.redo_stack.clear()
+        return delta
             
-    def undo(self) -> bool:
-        """Undo last command"""
-        if self.current_index >= 0:
-            self.history[self.current_index].undo()
-            self.current_index -= 1
-            return True
-        return False
+    def undo(self) -> Optional[SceneDelta]:
+        """Undo last command; returns what it changed, or None if there was nothing to undo"""
+        if self.history:
+            command = self.history.pop()
+            delta = command.undo()
+            self.redo_stack.append(command)
+            return delta
+        return None
         
-    def redo(self) -> bool:
-        """Redo last undone command"""
-        if self.current_index < len(self.history) - 1:
-            self.current_index += 1
-            self.history[self.current_index].execute()
-            return True
-        return False
+    def redo(self) -> Optional[SceneDelta]:
+        """Redo last undone command; returns what it changed, or None if there was nothing to redo"""
+        if self.redo_stack:
+            command = self.redo_stack.pop()
+            delta = command.execute()
+            self.history.append(command)
+            return delta
+        return None
         
     def clear(self):
         """Clear command history"""
         self.history.clear()
-        self.current_index = -1
+        self.redo_stack.clear()
@@ -1,137 +1,245 @@
 """Exporters for VOC, YOLO, and COCO formats"""
+import hashlib
 import json
-import xml.etree.ElementTree as ET
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, count
 from pathlib import Path
-from typing import List
+from xml.sax.saxutils import escape
+from typing import Dict, Iterator, List, Optional, Tuple
 from .models import Project, ImageData, Annotation
 
+try:
+    import orjson
+except ImportError:  # Optional; the stdlib encoder is used without it
+    orjson = None
+
+
+# Fingerprint (content digest, size, mtime) of what this process last wrote to each
+# export file; exports run on every image switch, so files whose content has not
+# changed are not rewritten, while files edited outside the app are
+_written_files: Dict[Path, Tuple[bytes, int, int]] = {}
+# export_all runs the exporters side by side, each recording its own files
+_written_files_lock = threading.Lock()
+
+
+# Below this many files, starting a thread pool costs more than overlapping the writes saves
+_PARALLEL_WRITE_MIN = 32
+
+
+def _digest(payload: bytes) -> bytes:
+    """Short content digest of an export payload"""
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+def _is_current(path: Path, digest: bytes) -> bool:
+    """Whether path still holds exactly what this process last wrote there"""
+    written = _written_files.get(path)
+    if written is None or written[0] != digest:
+        return False
+    try:
+        st = path.stat()
+    except OSError:
+        return False
+    return written[1] == st.st_size and written[2] == st.st_mtime_ns
+
+
+def _write_file(item: Tuple[Path, bytes, bytes]) -> Tuple[Path, Tuple[bytes, int, int]]:
+    """Write one (path, payload, digest) triple; returns the path and its new fingerprint"""
+    path, payload, digest = item
+    path.write_bytes(payload)
+    st = path.stat()
+    return path, (digest, st.st_size, st.st_mtime_ns)
+
+
+def _write_batch(pending: List[Tuple[Path, bytes]]):
+    """Write a batch of (path, payload) pairs, skipping files that are already up to date"""
+    changed = []
+    for path, payload in pending:
+        digest = _digest(payload)
+        if not _is_current(path, digest):
+            changed.append((path, payload, digest))
+    
+    # File writes release the GIL, so independent files can be written concurrently
+    if len(changed) >= _PARALLEL_WRITE_MIN:
+        with ThreadPoolExecutor() as executor:
+            written = list(executor.map(_write_file, changed))
+    else:
+        written = [_write_file(item) for item in changed]
+    
+    # Recorded here, once every write has succeeded, not from the pool's workers
+    with _written_files_lock:
+        _written_files.update(written)
+
+
+def _image_stems(project: Project) -> Dict[str, str]:
+    """Map each image filename to its stem, which names its VOC/YOLO export file"""
+    return {img.filename: Path(img.filename).stem for img in project.images}
+
+
+def _dump_json(data) -> bytes:
+    """Serialize export data to compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    # Without indent the stdlib uses its C encoder
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
 
 class VOCExporter:
     """Exports annotations in Pascal VOC XML format"""
     
     @staticmethod
-    def export(project: Project, output_dir: Path):
+    def export(project: Project, output_dir: Path, stems: Optional[Dict[str, str]] = None):
         """Export project to VOC format"""
+        if stems is None:
+            stems = _image_stems(project)
         annotations_dir = output_dir / "voc" / "Annotations"
         annotations_dir.mkdir(parents=True, exist_ok=True)
         
+        pending = []
+        escaped_names: Dict[str, str] = {}  # Class names repeat, so each is escaped once
         for image_data in project.images:
             if not image_data.annotations:
                 continue
-                
-            # Create XML
-            root = ET.Element("annotation")
-            
-            # Folder and filename
-            folder_elem = ET.SubElement(root, "folder")
-            folder_elem.text = Path(image_data.filepath).parent.name
-            filename_elem = ET.SubElement(root, "filename")
-            filename_elem.text = image_data.filename
-            
-            # Source
-            source = ET.SubElement(root, "source")
-            database = ET.SubElement(source, "database")
-            database.text = "AnnotationGUI"
             
-            # Size
-            size = ET.SubElement(root, "size")
-            width_elem = ET.SubElement(size, "width")
-            width_elem.text = str(image_data.width)
-            height_elem = ET.SubElement(size, "height")
-            height_elem.text = str(image_data.height)
-            depth_elem = ET.SubElement(size, "depth")
-            depth_elem.text = "3"
-            
-            # Segmented
-            segmented = ET.SubElement(root, "segmented")
-            segmented.text = "0"
+            # Build the XML as text; the VOC schema is fixed, so only values need escaping
+            parts = [
+                "<?xml version='1.0' encoding='utf-8'?>\n"
+                "<annotation>\n"
+                f"  <folder>{escape(image_data.path.parent.name)}</folder>\n"
+                f"  <filename>{escape(image_data.filename)}</filename>\n"
+                "  <source>\n"
+                "    <database>AnnotationGUI</database>\n"
+                "  </source>\n"
+                "  <size>\n"
+                f"    <width>{image_data.width}</width>\n"
+                f"    <height>{image_data.height}</height>\n"
+                "    <depth>3</depth>\n"
+                "  </size>\n"
+                "  <segmented>0</segmented>\n"
+            ]
             
             # Objects
             for ann in image_data.annotations:
-                if not ann.is_valid():
-                    continue
-                obj = ET.SubElement(root, "object")
-                name = ET.SubElement(obj, "name")
-                name.text = ann.class_name
-                pose = ET.SubElement(obj, "pose")
-                pose.text = "Unspecified"
-                truncated = ET.SubElement(obj, "truncated")
-                truncated.text = "0"
-                difficult = ET.SubElement(obj, "difficult")
-                difficult.text = "0"
+                x_min, y_min, x_max, y_max = ann.x_min, ann.y_min, ann.x_max, ann.y_max
+                if x_max <= x_min or y_max <= y_min:
+                    continue  # Invalid box
+                
+                class_name = escaped_names.get(ann.class_name)
+                if class_name is None:
+                    class_name = escaped_names[ann.class_name] = escape(ann.class_name)
                 
-                bndbox = ET.SubElement(obj, "bndbox")
-                xmin = ET.SubElement(bndbox, "xmin")
-                xmin.text = str(ann.x_min)
-                ymin = ET.SubElement(bndbox, "ymin")
-                ymin.text = str(ann.y_min)
-                xmax = ET.SubElement(bndbox, "xmax")
-                xmax.text = str(ann.x_max)
-                ymax = ET.SubElement(bndbox, "ymax")
-                ymax.text = str(ann.y_max)
+                parts.append(
+                    "  <object>\n"
+                    f"    <name>{class_name}</name>\n"
+                    "    <pose>Unspecified</pose>\n"
+                    "    <truncated>0</truncated>\n"
+                    "    <difficult>0</difficult>\n"
+                    "    <bndbox>\n"
+                    f"      <xmin>{x_min}</xmin>\n"
+                    f"      <ymin>{y_min}</ymin>\n"
+                    f"      <xmax>{x_max}</xmax>\n"
+                    f"      <ymax>{y_max}</ymax>\n"
+                    "    </bndbox>\n"
+                    "  </object>\n"
+                )
+            parts.append("</annotation>")
             
-            # Write XML
-            xml_file = annotations_dir / f"{Path(image_data.filename).stem}.xml"
-            tree = ET.ElementTree(root)
-            ET.indent(tree, space="  ")
-            tree.write(xml_file, encoding="utf-8", xml_declaration=True)
+            xml_file = annotations_dir / f"{stems[image_data.filename]}.xml"
+            pending.append((xml_file, "".join(parts).encode("utf-8")))
+        
+        # Write XML
+        _write_batch(pending)
 
 
 class YOLOExporter:
     """Exports annotations in YOLO format"""
     
     @staticmethod
-    def export(project: Project, output_dir: Path):
+    def export(project: Project, output_dir: Path, stems: Optional[Dict[str, str]] = None):
         """Export project to YOLO format"""
+        if stems is None:
+            stems = _image_stems(project)
         labels_dir = output_dir / "yolo" / "labels"
         labels_dir.mkdir(parents=True, exist_ok=True)
         
-        # Write classes.txt
+        # classes.txt
         classes_file = output_dir / "yolo" / "classes.txt"
-        with open(classes_file, 'w', encoding='utf-8') as f:
-            for cls in project.classes:
-                f.write(f"{cls.name}\n")
+        class_lines = "".join(f"{cls.name}\n" for cls in project.classes)
+        pending = [(classes_file, class_lines.encode("utf-8"))]
         
         # Export labels for each image (only create files for images with annotations)
         for image_data in project.images:
             if not image_data.annotations:
                 continue  # Skip images without annotations
                 
-            label_file = labels_dir / f"{Path(image_data.filename).stem}.txt"
+            label_file = labels_dir / f"{stems[image_data.filename]}.txt"
             
-            with open(label_file, 'w', encoding='utf-8') as f:
-                for ann in image_data.annotations:
-                    if not ann.is_valid():
-                        continue
-                    
-                    # Ensure we have valid image dimensions
-                    if image_data.width <= 0 or image_data.height <= 0:
-                        continue
-                    
-                    # Convert to YOLO format (normalized center-width-height)
-                    center_x = (ann.x_min + ann.x_max) / 2.0 / image_data.width
-                    center_y = (ann.y_min + ann.y_max) / 2.0 / image_data.height
-                    width = (ann.x_max - ann.x_min) / image_data.width
-                    height = (ann.y_max - ann.y_min) / image_data.height
-                    
-                    # Clamp to [0, 1]
-                    center_x = max(0.0, min(1.0, center_x))
-                    center_y = max(0.0, min(1.0, center_y))
-                    width = max(0.0, min(1.0, width))
-                    height = max(0.0, min(1.0, height))
-                    
-                    f.write(f"{ann.class_id} {center_x:.6f} {center_y:.6f} {width:.6f} {height:.6f}\n")
+            # Ensure we have valid image dimensions (the label file is still written, empty)
+            img_width, img_height = image_data.width, image_data.height
+            if img_width <= 0 or img_height <= 0:
+                pending.append((label_file, b""))
+                continue
+            
+            lines = []
+            for ann in image_data.annotations:
+                x_min, y_min, x_max, y_max = ann.x_min, ann.y_min, ann.x_max, ann.y_max
+                if x_max <= x_min or y_max <= y_min:
+                    continue  # Invalid box
+                
+                # Convert to YOLO format (normalized center-width-height)
+                center_x = (x_min + x_max) / 2.0 / img_width
+                center_y = (y_min + y_max) / 2.0 / img_height
+                width = (x_max - x_min) / img_width
+                height = (y_max - y_min) / img_height
+                
+                # Clamp to [0, 1]
+                center_x = max(0.0, min(1.0, center_x))
+                center_y = max(0.0, min(1.0, center_y))
+                width = max(0.0, min(1.0, width))
+                height = max(0.0, min(1.0, height))
+                
+                lines.append(f"{ann.class_id} {center_x:.6f} {center_y:.6f} {width:.6f} {height:.6f}\n")
+            pending.append((label_file, "".join(lines).encode("utf-8")))
+        
+        _write_batch(pending)
 
 
 class COCOExporter:
     """Exports annotations in COCO JSON format"""
     
     @staticmethod
-    def export(project: Project, output_dir: Path):
+    def export(project: Project, output_dir: Path, total_annotations: Optional[int] = None):
         """Export project to COCO format"""
         coco_dir = output_dir / "coco"
         coco_dir.mkdir(parents=True, exist_ok=True)
         
+        if total_annotations is None:
+            total_annotations = sum(len(img.annotations) for img in project.images)
+        
+        if total_annotations:
+            # Annotations, numbered consecutively across all images
+            annotation_ids = count(1)
+            annotations = list(chain.from_iterable(
+                COCOExporter._image_annotations(image_data, image_id, annotation_ids)
+                for image_id, image_data in enumerate(project.images, 1)
+            ))
+            
+            # All images are listed, even those without annotations
+            images = [
+                {
+                    "id": image_id,
+                    "width": image_data.width,
+                    "height": image_data.height,
+                    "file_name": image_data.filename
+                }
+                for image_id, image_data in enumerate(project.images, 1)
+            ]
+        else:
+            # Nothing is annotated yet; skip the per-image tables
+            annotations = []
+            images = []
+        
         # Build COCO structure
         coco_data = {
             "info": {
@@ -140,76 +248,43 @@ class COCOExporter:
                 "year": 2024
             },
             "licenses": [],
-            "images": [],
-            "annotations": [],
-            "categories": []
+            "images": images,
+            "annotations": annotations,
+            "categories": [
+                {"id": cls.id, "name": cls.name, "supercategory": "none"}
+                for cls in project.classes
+            ]
         }
         
-        # Categories
-        for cls in project.classes:
-            coco_data["categories"].append({
-                "id": cls.id,
-                "name": cls.name,
-                "supercategory": "none"
-            })
-        
-        # Images and annotations
-        image_id = 1
-        annotation_id = 1
-        
-        for image_data in project.images:
-            # Add image (add all images, even if they have no annotations)
-            coco_data["images"].append({
-                "id": image_id,
-                "width": image_data.width,
-                "height": image_data.height,
-                "file_name": image_data.filename
-            })
-            
-            # Add annotations for this image
-            for ann in image_data.annotations:
-                # Validate annotation
-                if not ann.is_valid():
-                    continue
-                
-                # Ensure valid coordinates
-                if ann.x_max <= ann.x_min or ann.y_max <= ann.y_min:
-                    continue
-                
-                # Ensure coordinates are within image bounds
-                if ann.x_min < 0 or ann.y_min < 0:
-                    continue
-                if ann.x_max > image_data.width or ann.y_max > image_data.height:
-                    continue
-                
-                bbox = [
-                    float(ann.x_min),
-                    float(ann.y_min),
-                    float(ann.x_max - ann.x_min),
-                    float(ann.y_max - ann.y_min)
-                ]
-                area = float((ann.x_max - ann.x_min) * (ann.y_max - ann.y_min))
-                
-                # Ensure positive area
-                if area <= 0:
-                    continue
-                
-                coco_data["annotations"].append({
-                    "id": annotation_id,
-                    "image_id": image_id,
-                    "category_id": ann.class_id,
-                    "bbox": bbox,
-                    "area": area,
-                    "iscrowd": 0
-                })
-                annotation_id += 1
-            
-            image_id += 1
-        
         # Write JSON
         json_file = coco_dir / "annotations.json"
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(coco_data, f, indent=2)
+        _write_batch([(json_file, _dump_json(coco_data))])
+    
+    @staticmethod
+    def _image_annotations(image_data: ImageData, image_id: int, annotation_ids: Iterator[int]):
+        """Yield COCO annotation entries for one image, skipping invalid boxes"""
+        img_width, img_height = image_data.width, image_data.height
+        for ann in image_data.annotations:
+            x_min, y_min, x_max, y_max = ann.x_min, ann.y_min, ann.x_max, ann.y_max
+            width = x_max - x_min
+            height = y_max - y_min
+            
+            # Ensure valid coordinates (this also guarantees a positive area)
+            if width <= 0 or height <= 0:
+                continue
+            
+            # Ensure coordinates are within image bounds
+            if x_min < 0 or y_min < 0 or x_max > img_width or y_max > img_height:
+                continue
+            
+            yield {
+                "id": next(annotation_ids),
+                "image_id": image_id,
+                "category_id": ann.class_id,
+                "bbox": [float(x_min), float(y_min), float(width), float(height)],
+                "area": float(width * height),
+                "iscrowd": 0
+            }
 
 
 class ExportManager:
@@ -231,9 +306,22 @@ class ExportManager:
             total_annotations = sum(len(img.annotations) for img in project.images)
             print(f"Exporting {total_annotations} annotations across {len(project.images)} images")
             
-            VOCExporter.export(project, output_dir)
-            YOLOExporter.export(project, output_dir)
-            COCOExporter.export(project, output_dir)
+            # The exporters only read the project and write to separate folders, so they
+            # can run side by side, overlapping COCO serialization with VOC/YOLO file I/O
+            stems = _image_stems(project)
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                futures = [
+                    executor.submit(VOCExporter.export, project, output_dir, stems),
+                    executor.submit(YOLOExporter.export, project, output_dir, stems),
+                    executor.submit(COCOExporter.export, project, output_dir, total_annotations)
+                ]
+            
+            # Report every failed format; the first one is raised below
+            errors = [future.exception() for future in futures if future.exception() is not None]
+            for error in errors[1:]:
+                print(f"Export error: {error}")
+            if errors:
+                raise errors[0]
             
             print(f"Export completed successfully to {output_dir}")
             return True
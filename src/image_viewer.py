@@ -1,5 +1,5 @@
 """Image viewer with pan and zoom functionality"""
-from PySide6.QtCore import Qt, QPoint, QPointF, Signal
+from PySide6.QtCore import Qt, QPoint, QPointF, QTimer, Signal
 from PySide6.QtGui import QWheelEvent, QMouseEvent, QKeyEvent, QPainter
 from PySide6.QtWidgets import QGraphicsView, QGraphicsScene
 from typing import Optional
@@ -31,6 +31,13 @@ class ImageViewer(QGraphicsView):
         self.min_zoom = 0.1
         self.max_zoom = 10.0
         
+        # Rubber-band updates: mouse moves while drawing are coalesced to one update per tick
+        self._pending_draw_pos: Optional[QPointF] = None
+        self._draw_update_timer = QTimer(self)
+        self._draw_update_timer.setSingleShot(True)
+        self._draw_update_timer.setInterval(8)
+        self._draw_update_timer.timeout.connect(self._flush_drawing_update)
+        
     def set_tool(self, tool: str):
         """Set current tool"""
         self.current_tool = tool
@@ -44,16 +51,13 @@ class ImageViewer(QGraphicsView):
         if event.modifiers() & Qt.ControlModifier:
             # Zoom at mouse position
             zoom_factor = self.zoom_factor if event.angleDelta().y() > 0 else 1.0 / self.zoom_factor
-            self.scale(zoom_factor, zoom_factor)
             
-            # Clamp zoom
+            # Clamp the target zoom first so the view is transformed (and repainted) once
             current_scale = self.transform().m11()
-            if current_scale < self.min_zoom:
-                self.resetTransform()
-                self.scale(self.min_zoom, self.min_zoom)
-            elif current_scale > self.max_zoom:
-                self.resetTransform()
-                self.scale(self.max_zoom, self.max_zoom)
+            target_scale = max(self.min_zoom, min(self.max_zoom, current_scale * zoom_factor))
+            if target_scale != current_scale:
+                step = target_scale / current_scale
+                self.scale(step, step)
         else:
             super().wheelEvent(event)
             
@@ -73,9 +77,9 @@ class ImageViewer(QGraphicsView):
     def mouseMoveEvent(self, event: QMouseEvent):
         """Handle mouse move"""
         if self.current_tool == "box" and self.scene.is_drawing:
-            scene_pos = self.mapToScene(event.pos())
-            self.scene.update_drawing_box(scene_pos)
-            self.box_drawing_updated.emit(scene_pos)
+            self._pending_draw_pos = self.mapToScene(event.pos())
+            if not self._draw_update_timer.isActive():
+                self._draw_update_timer.start()
         elif self.current_tool == "pan" and self.is_panning:
             delta = event.pos() - self.pan_start_pos
             self.horizontalScrollBar().setValue(
@@ -91,6 +95,8 @@ class ImageViewer(QGraphicsView):
     def mouseReleaseEvent(self, event: QMouseEvent):
         """Handle mouse release"""
         if self.current_tool == "box" and event.button() == Qt.LeftButton and self.scene.is_drawing:
+            self._draw_update_timer.stop()
+            self._pending_draw_pos = None
             scene_pos = self.mapToScene(event.pos())
             self.scene.finish_drawing_box(scene_pos)
             self.box_drawing_finished.emit(scene_pos)
@@ -100,10 +106,20 @@ class ImageViewer(QGraphicsView):
         else:
             super().mouseReleaseEvent(event)
             
+    def _flush_drawing_update(self):
+        """Apply the latest mouse position to the box being drawn"""
+        scene_pos = self._pending_draw_pos
+        self._pending_draw_pos = None
+        if scene_pos is None or not self.scene.is_drawing:
+            return
+        self.scene.update_drawing_box(scene_pos)
+        self.box_drawing_updated.emit(scene_pos)
+            
     def fit_to_window(self):
         """Fit image to window"""
-        if self.scene and self.scene.image_item:
-            self.fitInView(self.scene.image_item, Qt.KeepAspectRatio)
+        # Fit the header size: the image item stays empty until its pixels are decoded
+        if self.scene and self.scene.image_rect is not None:
+            self.fitInView(self.scene.image_rect, Qt.KeepAspectRatio)
             
     def zoom_100(self):
         """Zoom to 100%"""
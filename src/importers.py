@@ -1,9 +1,30 @@
 """Importers for loading existing annotations from export formats"""
 import json
-import xml.etree.ElementTree as ET
+import os
+try:
+    from lxml import etree
+except ImportError:  # Optional; the stdlib parser is used without it
+    import xml.etree.ElementTree as etree
 from pathlib import Path
-from typing import List, Optional, Dict
-from .models import Project, ImageData, Annotation, ClassDefinition
+from typing import List, Optional, Dict, Tuple
+from .models import Project, ImageData, Annotation, ClassDefinition, intern_name
+
+
+def _list_files(folder: Path, suffix: str) -> List[Tuple[Path, str]]:
+    """List (path, stem) for the files in a folder with the given suffix, in one directory scan"""
+    with os.scandir(folder) as entries:
+        names = sorted(
+            entry.name for entry in entries
+            if len(entry.name) > len(suffix)
+            and os.path.normcase(entry.name).endswith(suffix)
+            and entry.is_file()
+        )
+    return [(folder / name, name[:-len(suffix)]) for name in names]
+
+
+def _class_name_map(project: Project) -> Dict[str, int]:
+    """Map class names to IDs; the first class wins if a name is repeated"""
+    return {cls.name: cls.id for cls in reversed(project.classes)}
 
 
 class VOCImporter:
@@ -17,73 +38,44 @@ class VOCImporter:
             return False
         
         imported = False
+        name_to_id = _class_name_map(project)
         # Create a mapping of filename to ImageData
         filename_to_image = {img.filename: img for img in project.images}
         
-        # Also try matching by stem (filename without extension)
-        stem_to_image = {Path(img.filename).stem: img for img in project.images}
+        # Also try matching by stem (filename without extension); only built on a filename miss
+        stem_to_image: Optional[Dict[str, ImageData]] = None
         
-        for xml_file in annotations_dir.glob("*.xml"):
+        for xml_file, xml_stem in _list_files(annotations_dir, ".xml"):
             try:
-                tree = ET.parse(xml_file)
-                root = tree.getroot()
-                
-                # Get filename from XML
-                filename_elem = root.find("filename")
-                if filename_elem is None:
-                    continue
-                filename = filename_elem.text
-                
-                # Try to find matching image
-                image_data = filename_to_image.get(filename)
-                if not image_data:
-                    # Try by stem
-                    xml_stem = xml_file.stem
-                    image_data = stem_to_image.get(xml_stem)
-                
-                if not image_data:
-                    continue
+                # Stream the file; <filename> precedes the objects in VOC, so files for
+                # unknown or already annotated images are abandoned without parsing the rest
+                image_data = None
+                objects = []  # (class_name, x_min, y_min, x_max, y_max) per <object>
+                with open(xml_file, 'rb') as f:
+                    for _, elem in etree.iterparse(f):
+                        tag = elem.tag
+                        if tag == "object":
+                            obj = VOCImporter._parse_object(elem)
+                            if obj is not None:
+                                objects.append(obj)
+                            elem.clear()
+                        elif tag == "filename" and image_data is None:
+                            # Try to find matching image, by filename and then by stem
+                            image_data = filename_to_image.get(elem.text)
+                            if not image_data:
+                                if stem_to_image is None:
+                                    stem_to_image = {Path(img.filename).stem: img for img in project.images}
+                                image_data = stem_to_image.get(xml_stem)
+                            
+                            # Only import if image has no existing annotations (don't overwrite project.json data)
+                            if not image_data or image_data.annotations:
+                                break
                 
-                # Only import if image has no existing annotations (don't overwrite project.json data)
-                if image_data.annotations:
+                # Only a file that parsed completely adds classes and boxes
+                if image_data is None or image_data.annotations:
                     continue
-                
-                # Clear existing annotations for this image (should be empty anyway)
-                image_data.annotations.clear()
-                
-                # Parse objects
-                for obj in root.findall("object"):
-                    name_elem = obj.find("name")
-                    if name_elem is None:
-                        continue
-                    class_name = name_elem.text
-                    
-                    # Find or create class
-                    class_id = VOCImporter._get_or_create_class(project, class_name)
-                    
-                    bndbox = obj.find("bndbox")
-                    if bndbox is None:
-                        continue
-                    
-                    xmin = int(float(bndbox.find("xmin").text))
-                    ymin = int(float(bndbox.find("ymin").text))
-                    xmax = int(float(bndbox.find("xmax").text))
-                    ymax = int(float(bndbox.find("ymax").text))
-                    
-                    annotation = Annotation(
-                        class_id=class_id,
-                        class_name=class_name,
-                        x_min=xmin,
-                        y_min=ymin,
-                        x_max=xmax,
-                        y_max=ymax
-                    )
-                    
-                    # Clamp to image bounds
-                    annotation.clamp_to_bounds(image_data.width, image_data.height)
-                    
-                    if annotation.is_valid():
-                        image_data.annotations.append(annotation)
+                for obj in objects:
+                    if VOCImporter._import_object(obj, image_data, project, name_to_id):
                         imported = True
                         
             except Exception as e:
@@ -93,15 +85,59 @@ class VOCImporter:
         return imported
     
     @staticmethod
-    def _get_or_create_class(project: Project, class_name: str) -> int:
+    def _parse_object(obj) -> Optional[Tuple[str, int, int, int, int]]:
+        """Read (class_name, x_min, y_min, x_max, y_max) from a VOC <object> element"""
+        name_elem = obj.find("name")
+        if name_elem is None:
+            return None
+        
+        bndbox = obj.find("bndbox")
+        if bndbox is None:
+            return None
+        
+        xmin = int(float(bndbox.find("xmin").text))
+        ymin = int(float(bndbox.find("ymin").text))
+        xmax = int(float(bndbox.find("xmax").text))
+        ymax = int(float(bndbox.find("ymax").text))
+        return intern_name(name_elem.text), xmin, ymin, xmax, ymax
+    
+    @staticmethod
+    def _import_object(obj: Tuple[str, int, int, int, int], image_data: ImageData, project: Project,
+                       name_to_id: Dict[str, int]) -> bool:
+        """Add a box parsed by _parse_object to an image; returns True if added"""
+        class_name, xmin, ymin, xmax, ymax = obj
+        
+        # Find or create class
+        class_id = VOCImporter._get_or_create_class(project, class_name, name_to_id)
+        
+        annotation = Annotation(
+            class_id=class_id,
+            class_name=class_name,
+            x_min=xmin,
+            y_min=ymin,
+            x_max=xmax,
+            y_max=ymax
+        )
+        
+        # Clamp to image bounds
+        annotation.clamp_to_bounds(image_data.width, image_data.height)
+        
+        if not annotation.is_valid():
+            return False
+        image_data.annotations.append(annotation)
+        return True
+    
+    @staticmethod
+    def _get_or_create_class(project: Project, class_name: str, name_to_id: Dict[str, int]) -> int:
         """Get class ID by name, or create new class if not found"""
-        for cls in project.classes:
-            if cls.name == class_name:
-                return cls.id
+        class_id = name_to_id.get(class_name)
+        if class_id is not None:
+            return class_id
         
         # Create new class
         class_id = len(project.classes)
         project.classes.append(ClassDefinition(id=class_id, name=class_name, color="#FF0000"))
+        name_to_id[class_name] = class_id
         return class_id
 
 
@@ -118,6 +154,7 @@ class YOLOImporter:
             return False
         
         imported = False
+        name_to_id = _class_name_map(project)
         
         # Load class names from classes.txt if it exists
         class_names = {}
@@ -129,94 +166,93 @@ class YOLOImporter:
                         if class_name:
                             class_names[idx] = class_name
                             # Ensure class exists in project
-                            YOLOImporter._get_or_create_class(project, class_name)
+                            YOLOImporter._get_or_create_class(project, class_name, name_to_id)
             except Exception:
                 pass
         
         # Create mapping of filename stem to ImageData
         stem_to_image = {Path(img.filename).stem: img for img in project.images}
         
-        for label_file in labels_dir.glob("*.txt"):
+        # YOLO class index -> (project class ID, class name), resolved on first use
+        resolved_classes: Dict[int, Tuple[int, str]] = {}
+        
+        for label_file, stem in _list_files(labels_dir, ".txt"):
+            image_data = stem_to_image.get(stem)
+            
+            if not image_data:
+                continue
+            
+            # Only import if image has no existing annotations (don't overwrite project.json data)
+            if image_data.annotations:
+                continue
+            
+            # Read annotations (the whole file in one call)
             try:
-                stem = label_file.stem
-                image_data = stem_to_image.get(stem)
-                
-                if not image_data:
-                    continue
-                
-                # Only import if image has no existing annotations (don't overwrite project.json data)
-                if image_data.annotations:
-                    continue
-                
-                # Clear existing annotations (should be empty anyway)
-                image_data.annotations.clear()
-                
-                # Read annotations
                 with open(label_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        
-                        parts = line.split()
-                        if len(parts) < 5:
-                            continue
-                        
-                        try:
-                            class_id = int(parts[0])
-                            center_x = float(parts[1])
-                            center_y = float(parts[2])
-                            width = float(parts[3])
-                            height = float(parts[4])
-                            
-                            # Convert from normalized YOLO format to absolute pixels
-                            x_min = int((center_x - width / 2) * image_data.width)
-                            y_min = int((center_y - height / 2) * image_data.height)
-                            x_max = int((center_x + width / 2) * image_data.width)
-                            y_max = int((center_y + height / 2) * image_data.height)
-                            
-                            # Get class name
-                            class_name = class_names.get(class_id, f"class_{class_id}")
-                            
-                            # Ensure class exists
-                            actual_class_id = YOLOImporter._get_or_create_class(project, class_name)
-                            
-                            annotation = Annotation(
-                                class_id=actual_class_id,
-                                class_name=class_name,
-                                x_min=x_min,
-                                y_min=y_min,
-                                x_max=x_max,
-                                y_max=y_max
-                            )
-                            
-                            # Clamp to image bounds
-                            annotation.clamp_to_bounds(image_data.width, image_data.height)
-                            
-                            if annotation.is_valid():
-                                image_data.annotations.append(annotation)
-                                imported = True
-                                
-                        except (ValueError, IndexError) as e:
-                            print(f"Error parsing YOLO line in {label_file}: {e}")
-                            continue
-                            
+                    lines = f.read().splitlines()
             except Exception as e:
                 print(f"Error importing YOLO file {label_file}: {e}")
                 continue
+            
+            img_width, img_height = image_data.width, image_data.height
+            for line in lines:
+                parts = line.split()
+                if len(parts) < 5:
+                    continue  # Blank or short line
+                
+                try:
+                    class_id = int(parts[0])
+                    center_x, center_y, width, height = map(float, parts[1:5])
+                    
+                    # Convert from normalized YOLO format to absolute pixels
+                    half_width = width / 2
+                    half_height = height / 2
+                    x_min = int((center_x - half_width) * img_width)
+                    y_min = int((center_y - half_height) * img_height)
+                    x_max = int((center_x + half_width) * img_width)
+                    y_max = int((center_y + half_height) * img_height)
+                    
+                    # Get class name and ensure the class exists
+                    resolved = resolved_classes.get(class_id)
+                    if resolved is None:
+                        class_name = class_names.get(class_id, f"class_{class_id}")
+                        actual_class_id = YOLOImporter._get_or_create_class(project, class_name, name_to_id)
+                        resolved = resolved_classes[class_id] = (actual_class_id, class_name)
+                    actual_class_id, class_name = resolved
+                    
+                    annotation = Annotation(
+                        class_id=actual_class_id,
+                        class_name=class_name,
+                        x_min=x_min,
+                        y_min=y_min,
+                        x_max=x_max,
+                        y_max=y_max
+                    )
+                    
+                    # Clamp to image bounds
+                    annotation.clamp_to_bounds(img_width, img_height)
+                    
+                    if annotation.is_valid():
+                        image_data.annotations.append(annotation)
+                        imported = True
+                
+                except (ValueError, IndexError) as e:
+                    print(f"Error parsing YOLO line in {label_file}: {e}")
+                    continue
         
         return imported
     
     @staticmethod
-    def _get_or_create_class(project: Project, class_name: str) -> int:
+    def _get_or_create_class(project: Project, class_name: str, name_to_id: Dict[str, int]) -> int:
         """Get class ID by name, or create new class if not found"""
-        for cls in project.classes:
-            if cls.name == class_name:
-                return cls.id
+        class_id = name_to_id.get(class_name)
+        if class_id is not None:
+            return class_id
         
         # Create new class
         class_id = len(project.classes)
         project.classes.append(ClassDefinition(id=class_id, name=class_name, color="#FF0000"))
+        name_to_id[class_name] = class_id
         return class_id
 
 
@@ -238,10 +274,11 @@ class COCOImporter:
             
             # Load categories and create class mapping
             category_id_to_class = {}
+            name_to_id = _class_name_map(project)
             for cat in coco_data.get("categories", []):
                 cat_id = cat.get("id")
                 cat_name = cat.get("name", f"class_{cat_id}")
-                class_id = COCOImporter._get_or_create_class(project, cat_name)
+                class_id = COCOImporter._get_or_create_class(project, cat_name, name_to_id)
                 category_id_to_class[cat_id] = (class_id, cat_name)
             
             # Create mapping of filename to ImageData
@@ -265,11 +302,11 @@ class COCOImporter:
                 if not image_data:
                     continue
                 
-                category_id = ann_entry.get("category_id")
-                if category_id not in category_id_to_class:
+                category = category_id_to_class.get(ann_entry.get("category_id"))
+                if category is None:
                     continue
                 
-                class_id, class_name = category_id_to_class[category_id]
+                class_id, class_name = category
                 
                 bbox = ann_entry.get("bbox", [])
                 if len(bbox) < 4:
@@ -306,15 +343,16 @@ class COCOImporter:
             return False
     
     @staticmethod
-    def _get_or_create_class(project: Project, class_name: str) -> int:
+    def _get_or_create_class(project: Project, class_name: str, name_to_id: Dict[str, int]) -> int:
         """Get class ID by name, or create new class if not found"""
-        for cls in project.classes:
-            if cls.name == class_name:
-                return cls.id
+        class_id = name_to_id.get(class_name)
+        if class_id is not None:
+            return class_id
         
         # Create new class
         class_id = len(project.classes)
         project.classes.append(ClassDefinition(id=class_id, name=class_name, color="#FF0000"))
+        name_to_id[class_name] = class_id
         return class_id
 
 
@@ -1,22 +1,139 @@
 """Main application window"""
 import json
-from PySide6.QtCore import Qt, QSize, Signal
+from PySide6.QtCore import (
+    Qt, QSize, Signal, QAbstractListModel, QModelIndex, QItemSelectionModel, QSignalBlocker, QTimer,
+    QRunnable, QThreadPool
+)
 from PySide6.QtGui import QKeySequence, QShortcut, QColor
 from PySide6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QSplitter,
-    QListWidget, QListWidgetItem, QLabel, QPushButton, QComboBox,
+    QListWidget, QListWidgetItem, QListView, QLabel, QPushButton, QComboBox,
     QGroupBox, QMessageBox, QFileDialog, QMenuBar, QMenu, QToolBar,
-    QStatusBar, QLineEdit, QInputDialog, QColorDialog
+    QStatusBar, QLineEdit, QInputDialog, QColorDialog, QAbstractItemView
 )
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from .project_manager import ProjectManager
 from .annotation_scene import AnnotationScene
 from .image_viewer import ImageViewer
-from .commands import CommandHistory, CreateBoxCommand, DeleteBoxCommand, DeleteBoxesCommand, MoveBoxCommand, ResizeBoxCommand, ChangeClassCommand
+from .commands import CommandHistory, CreateBoxCommand, DeleteBoxCommand, DeleteBoxesCommand, MoveBoxCommand, ResizeBoxCommand, ChangeClassCommand, SceneDelta
 from .exporters import ExportManager
-from .models import Annotation
+from .models import Annotation, ClassDefinition, ImageData, Project
+
+
+# Shortcuts without a standard key, parsed once
+_FIT_SEQ = QKeySequence("Ctrl+0")
+_ZOOM_100_SEQ = QKeySequence("Ctrl+1")
+_ZOOM_IN_SEQ = QKeySequence("Ctrl++")
+_ZOOM_OUT_SEQ = QKeySequence("Ctrl+-")
+
+
+# Parsed class colors, keyed by color string; a recolored class simply maps to a new key
+_COLOR_CACHE: Dict[str, QColor] = {}
+
+
+def _qcolor(color_str: str) -> QColor:
+    """Get the cached QColor for a class color string, parsing it only once"""
+    color = _COLOR_CACHE.get(color_str)
+    if color is None:
+        color = _COLOR_CACHE[color_str] = QColor(color_str)
+    return color
+
+
+# Body of Help > Keyboard Shortcuts
+_SHORTCUTS_TEXT = """
+Keyboard Shortcuts:
+
+Navigation:
+  ← / → or A / D - Previous/Next image
+  Home / End - First/Last image
+
+Tools:
+  S - Select tool
+  B - Box (draw) tool
+  H - Pan tool
+
+Box Operations:
+  Delete / Backspace - Delete selected box(es)
+  Ctrl+A - Select all boxes
+  Escape - Deselect all
+  1-9, 0 - Assign class by number
+
+Zoom:
+  Ctrl + Mouse Wheel - Zoom in/out
+  Ctrl+0 - Fit to window
+  Ctrl+1 - 100% zoom
+  Ctrl++ / Ctrl+- - Zoom in/out
+
+General:
+  Ctrl+Z - Undo
+  Ctrl+Y - Redo
+  Ctrl+S - Save
+  Ctrl+O - Open folder
+        """
+
+
+# Saves within this many milliseconds of each other share one auto-export
+_EXPORT_INTERVAL_MS = 2000
+
+
+class _ExportRunnable(QRunnable):
+    """Exports a project snapshot on a worker thread"""
+    
+    def __init__(self, project: Project, project_path: Path):
+        super().__init__()
+        self.project = project
+        self.project_path = project_path
+        
+    def run(self):
+        ExportManager.export_all(self.project, self.project_path)
+
+
+class ImageListModel(QAbstractListModel):
+    """List model over the project's images; the view only asks for rows it shows"""
+    
+    def __init__(self, project_manager: ProjectManager, parent=None):
+        super().__init__(parent)
+        self.project_manager = project_manager
+        
+    def _images(self) -> List[ImageData]:
+        """Get the current project's images"""
+        project = self.project_manager.project
+        return project.images if project else []
+        
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        """Number of images"""
+        if parent.isValid():
+            return 0
+        return len(self._images())
+        
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        """Row text (checked when annotated) and image index"""
+        images = self._images()
+        if not index.isValid() or index.row() >= len(images):
+            return None
+        if role == Qt.DisplayRole:
+            img_data = images[index.row()]
+            return f"✓ {img_data.filename}" if img_data.annotations else img_data.filename
+        if role == Qt.UserRole:
+            return index.row()
+        return None
+        
+    def reset(self):
+        """Re-read the image list after it was loaded or resynced"""
+        self.beginResetModel()
+        self.endResetModel()
+        
+    def refresh_row(self, row: int):
+        """Re-read one image's row after its annotated state changed"""
+        index = self.index(row, 0)
+        self.dataChanged.emit(index, index, [Qt.DisplayRole])
+        
+    def refresh_all(self):
+        """Re-read every row after annotations changed across many images"""
+        if self.rowCount():
+            self.dataChanged.emit(self.index(0, 0), self.index(self.rowCount() - 1, 0), [Qt.DisplayRole])
 
 
 class MainWindow(QMainWindow):
@@ -34,10 +151,32 @@ class MainWindow(QMainWindow):
         self.viewer: Optional[ImageViewer] = None
         
         # UI components
-        self.image_list: Optional[QListWidget] = None
+        self.image_model = ImageListModel(self.project_manager, self)
+        self.image_list: Optional[QListView] = None
         self.class_list: Optional[QListWidget] = None
         self.class_combo: Optional[QComboBox] = None
         self.status_label: Optional[QLabel] = None
+        # Class id -> row in class_list and class_combo, rebuilt with the class list
+        self._class_id_to_row: Dict[int, int] = {}
+        # The project's class list as last shown, for the number-key shortcuts
+        self._classes: List[ClassDefinition] = []
+        
+        # Set while a post-edit refresh is queued; edits in one event-loop turn share a refresh
+        self._refresh_pending = False
+        # Set by every edit; navigation only saves and exports when something changed
+        self._dirty = False
+        
+        # Auto-export runs in the background, at most once per interval
+        self._export_timer = QTimer(self)
+        self._export_timer.setSingleShot(True)
+        self._export_timer.setInterval(_EXPORT_INTERVAL_MS)
+        self._export_timer.timeout.connect(self._start_export)
+        # A single worker, so two exports never write the same files at once
+        self._export_pool = QThreadPool(self)
+        self._export_pool.setMaxThreadCount(1)
+        # id(image) -> (image, copy handed to the export worker); copies are never edited,
+        # so images not edited since are shared with the next export instead of copied again
+        self._export_copies: Dict[int, Tuple[ImageData, ImageData]] = {}
         
         self.setup_ui()
         self.setup_shortcuts()
@@ -104,10 +243,10 @@ class MainWindow(QMainWindow):
         
         # View menu
         view_menu = menubar.addMenu("&View")
-        view_menu.addAction("Fit to &Window", self.fit_to_window, "Ctrl+0")
-        view_menu.addAction("&100% Zoom", self.zoom_100, "Ctrl+1")
-        view_menu.addAction("Zoom &In", self.zoom_in, "Ctrl++")
-        view_menu.addAction("Zoom &Out", self.zoom_out, "Ctrl+-")
+        view_menu.addAction("Fit to &Window", self.fit_to_window, _FIT_SEQ)
+        view_menu.addAction("&100% Zoom", self.zoom_100, _ZOOM_100_SEQ)
+        view_menu.addAction("Zoom &In", self.zoom_in, _ZOOM_IN_SEQ)
+        view_menu.addAction("Zoom &Out", self.zoom_out, _ZOOM_OUT_SEQ)
         
         # Help menu
         help_menu = menubar.addMenu("&Help")
@@ -123,17 +262,17 @@ class MainWindow(QMainWindow):
         self.select_tool_btn = QPushButton("Select (S)")
         self.select_tool_btn.setCheckable(True)
         self.select_tool_btn.setChecked(True)
-        self.select_tool_btn.clicked.connect(lambda: self.set_tool("select"))
+        self.select_tool_btn.clicked.connect(self._set_tool_select)
         toolbar.addWidget(self.select_tool_btn)
         
         self.box_tool_btn = QPushButton("Box (B)")
         self.box_tool_btn.setCheckable(True)
-        self.box_tool_btn.clicked.connect(lambda: self.set_tool("box"))
+        self.box_tool_btn.clicked.connect(self._set_tool_box)
         toolbar.addWidget(self.box_tool_btn)
         
         self.pan_tool_btn = QPushButton("Pan (H)")
         self.pan_tool_btn.setCheckable(True)
-        self.pan_tool_btn.clicked.connect(lambda: self.set_tool("pan"))
+        self.pan_tool_btn.clicked.connect(self._set_tool_pan)
         toolbar.addWidget(self.pan_tool_btn)
         
         toolbar.addSeparator()
@@ -171,8 +310,10 @@ class MainWindow(QMainWindow):
         layout.addWidget(label)
         
         # Image list
-        self.image_list = QListWidget()
-        self.image_list.itemDoubleClicked.connect(self.on_image_list_double_click)
+        self.image_list = QListView()
+        self.image_list.setModel(self.image_model)
+        self.image_list.setUniformItemSizes(True)  # Fixed row height lets Qt skip per-row layout
+        self.image_list.doubleClicked.connect(self.on_image_list_double_click)
         layout.addWidget(self.image_list)
         
         # Status
@@ -193,6 +334,8 @@ class MainWindow(QMainWindow):
         
         # Connect signals
         self.scene.box_created.connect(self.on_box_created)
+        self.scene.box_changed.connect(self.on_box_changed)
+        self.scene.image_load_failed.connect(self.on_image_load_failed)
         
         layout.addWidget(self.viewer)
         return panel
@@ -209,6 +352,7 @@ class MainWindow(QMainWindow):
         
         # Class list
         self.class_list = QListWidget()
+        self.class_list.setUniformItemSizes(True)
         self.class_list.itemDoubleClicked.connect(self.on_class_double_click)
         self.class_list.setContextMenuPolicy(Qt.CustomContextMenu)
         self.class_list.customContextMenuRequested.connect(self.show_class_context_menu)
@@ -251,17 +395,17 @@ class MainWindow(QMainWindow):
     def setup_shortcuts(self):
         """Setup keyboard shortcuts"""
         # Tool shortcuts
-        QShortcut("S", self, lambda: self.set_tool("select"))
-        QShortcut("B", self, lambda: self.set_tool("box"))
-        QShortcut("H", self, lambda: self.set_tool("pan"))
+        QShortcut("S", self, self._set_tool_select)
+        QShortcut("B", self, self._set_tool_box)
+        QShortcut("H", self, self._set_tool_pan)
         
         # Navigation
         QShortcut("Left", self, self.previous_image)
         QShortcut("Right", self, self.next_image)
         QShortcut("A", self, self.previous_image)
         QShortcut("D", self, self.next_image)
-        QShortcut("Home", self, lambda: self.set_current_image(0))
-        QShortcut("End", self, lambda: self.set_current_image(len(self.project_manager.project.images) - 1 if self.project_manager.project else 0))
+        QShortcut("Home", self, self.first_image)
+        QShortcut("End", self, self.last_image)
         
         # Number keys for classes
         for i in range(10):
@@ -320,15 +464,14 @@ class MainWindow(QMainWindow):
         if not self.project_manager.project:
             return
             
+        # A new or just-imported project has not been written yet
+        self._dirty = True
+        self._export_copies = {}
+        # Commands of the previous project refer to its images and classes
+        self.command_history.clear()
+        
         # Load image list
-        self.image_list.clear()
-        for i, img_data in enumerate(self.project_manager.project.images):
-            item = QListWidgetItem(img_data.filename)
-            item.setData(Qt.UserRole, i)
-            # Check if annotated
-            if img_data.annotations:
-                item.setText(f"✓ {img_data.filename}")
-            self.image_list.addItem(item)
+        self.image_model.reset()
             
         # Load class list
         self.update_class_list()
@@ -341,22 +484,31 @@ class MainWindow(QMainWindow):
         
     def update_class_list(self):
         """Update class list widget"""
-        self.class_list.clear()
-        self.class_combo.clear()
-        
-        if not self.project_manager.project:
-            return
-            
-        for i, cls in enumerate(self.project_manager.project.classes):
-            # List widget
-            item = QListWidgetItem(f"{i}: {cls.name}")
-            item.setData(Qt.UserRole, cls.id)
-            color = QColor(cls.color)
-            item.setForeground(color)
-            self.class_list.addItem(item)
-            
-            # Combo box
-            self.class_combo.addItem(cls.name, cls.id)
+        # Repopulating would otherwise fire currentIndexChanged per item and reassign the selection
+        with QSignalBlocker(self.class_combo), QSignalBlocker(self.class_list):
+            # Lay out and paint the list once, after all rows are in
+            self.class_list.setUpdatesEnabled(False)
+            try:
+                self.class_list.clear()
+                self.class_combo.clear()
+                self._class_id_to_row = {}
+                self._classes = self.project_manager.project.classes if self.project_manager.project else []
+                
+                if not self.project_manager.project:
+                    return
+                    
+                for i, cls in enumerate(self.project_manager.project.classes):
+                    # List widget
+                    item = QListWidgetItem(f"{i}: {cls.name}")
+                    item.setData(Qt.UserRole, cls.id)
+                    item.setForeground(_qcolor(cls.color))
+                    self.class_list.addItem(item)
+                    
+                    # Combo box
+                    self.class_combo.addItem(cls.name, cls.id)
+                    self._class_id_to_row.setdefault(cls.id, i)
+            finally:
+                self.class_list.setUpdatesEnabled(True)
             
     def set_current_image(self, index: int):
         """Set current image"""
@@ -372,15 +524,22 @@ class MainWindow(QMainWindow):
         self.viewer.fit_to_window()
         
         # Update image list selection
-        for i in range(self.image_list.count()):
-            item = self.image_list.item(i)
-            if item.data(Qt.UserRole) == index:
-                self.image_list.setCurrentItem(item)
-                break
+        model_index = self.image_model.index(index, 0)
+        self.image_list.selectionModel().setCurrentIndex(model_index, QItemSelectionModel.ClearAndSelect)
+        self.image_list.scrollTo(model_index, QAbstractItemView.PositionAtCenter)
                 
         self.update_status()
         self.update_box_properties()
         
+    def first_image(self):
+        """Navigate to the first image"""
+        self.set_current_image(0)
+        
+    def last_image(self):
+        """Navigate to the last image"""
+        if self.project_manager.project:
+            self.set_current_image(len(self.project_manager.project.images) - 1)
+        
     def next_image(self):
         """Navigate to next image"""
         if not self.project_manager.project:
@@ -399,25 +558,50 @@ class MainWindow(QMainWindow):
             self.save_current_annotations()
             self.set_current_image(current - 1)
             
-    def save_current_annotations(self):
-        """Save current image annotations"""
+    def save_current_annotations(self, force: bool = False):
+        """Save current image annotations if anything changed (or always, with force)"""
         if not self.project_manager.project:
             return
         
-        # Ensure current image annotations are synced from scene
-        if self.scene and self.scene.current_image_data:
-            image_data = self.project_manager.get_current_image()
-            if image_data:
-                # Sync annotations from scene to project (they should already be the same reference)
-                # But ensure all boxes in scene are in the annotations list
-                scene_annotations = [box_item.annotation for box_item in self.scene.box_items]
-                # Update the annotations list to match scene
-                image_data.annotations = scene_annotations
+        # Every edit goes through a command or the scene's box_changed signal and marks the
+        # project dirty, and the scene edits the image's own annotation objects, so an
+        # unchanged project has nothing to write
+        if not self._dirty and not force:
+            return
         
         # Save project and auto-export
         if self.project_manager.save_project():
-            if self.project_manager.project_path:
-                ExportManager.export_all(self.project_manager.project, self.project_manager.project_path)
+            self._dirty = False
+            if self.project_manager.project_path and not self._export_timer.isActive():
+                self._export_timer.start()
+                
+    def _start_export(self):
+        """Hand a snapshot of the project to the export worker"""
+        project = self.project_manager.project
+        project_path = self.project_manager.project_path
+        if not project or not project_path:
+            return
+        # The worker gets its own copy, so edits made while it runs cannot race with it;
+        # only images edited since the last export are copied again
+        cached = self._export_copies
+        copies: Dict[int, Tuple[ImageData, ImageData]] = {}
+        images = []
+        for img in project.images:
+            entry = cached.get(id(img))
+            if entry is None or entry[0] is not img:
+                entry = (img, img.copy())
+            copies[id(img)] = entry
+            images.append(entry[1])
+        self._export_copies = copies
+        self._export_pool.start(_ExportRunnable(project.copy(images), project_path))
+        
+    def _mark_edited(self, image_data: Optional[ImageData]):
+        """Mark the project changed after boxes of image_data (None: of any image) were edited"""
+        self._dirty = True
+        if image_data is None:
+            self._export_copies = {}
+        else:
+            self._export_copies.pop(id(image_data), None)
                 
     def set_tool(self, tool: str):
         """Set current tool"""
@@ -426,11 +610,22 @@ class MainWindow(QMainWindow):
         self.box_tool_btn.setChecked(tool == "box")
         self.pan_tool_btn.setChecked(tool == "pan")
         
-    def on_image_list_double_click(self, item: QListWidgetItem):
+    def _set_tool_select(self):
+        """Switch to the select tool"""
+        self.set_tool("select")
+        
+    def _set_tool_box(self):
+        """Switch to the box (draw) tool"""
+        self.set_tool("box")
+        
+    def _set_tool_pan(self):
+        """Switch to the pan tool"""
+        self.set_tool("pan")
+        
+    def on_image_list_double_click(self, index: QModelIndex):
         """Handle image list double click"""
-        index = item.data(Qt.UserRole)
         self.save_current_annotations()
-        self.set_current_image(index)
+        self.set_current_image(index.row())
         
     def on_box_created(self, annotation: Annotation):
         """Handle box creation"""
@@ -438,17 +633,18 @@ class MainWindow(QMainWindow):
         image_data = self.project_manager.get_current_image()
         if image_data:
             cmd = CreateBoxCommand(image_data, annotation)
-            self.command_history.execute_command(cmd)
+            self._track_class_use(self.command_history.execute_command(cmd))
+            self._mark_edited(image_data)
+            self.on_annotations_changed(image_data)
+            self._schedule_refresh()
             
-            # Force view update to show the new box
-            if self.viewer:
-                self.viewer.viewport().update()
-                self.viewer.update()
-            if self.scene:
-                self.scene.update()
-                
-            self.update_status()
-            self.update_box_properties()
+    def on_image_load_failed(self, filepath: str):
+        """Tell the user an image could not be read or decoded"""
+        self.statusBar().showMessage(f"Could not load image: {Path(filepath).name}", 5000)
+            
+    def on_box_changed(self, annotation: Annotation):
+        """Handle a box being moved or resized"""
+        self._mark_edited(self.scene.current_image_data)
             
     def select_all_boxes(self):
         """Select all boxes"""
@@ -479,16 +675,57 @@ class MainWindow(QMainWindow):
             cmd = DeleteBoxCommand(image_data, selected[0])
         else:
             cmd = DeleteBoxesCommand(image_data, selected)
-        self.command_history.execute_command(cmd)
+        self._track_class_use(self.command_history.execute_command(cmd))
+        self._mark_edited(image_data)
+        self.on_annotations_changed(image_data)
         
         # Remove from scene
-        for box_item in self.scene.box_items[:]:
-            if box_item.annotation in selected:
+        if len(selected) == 1:
+            box_item = self.scene.box_item_for(selected[0])
+            if box_item:
                 self.scene.remove_box_item(box_item)
+        else:
+            box_items = [self.scene.box_item_for(ann) for ann in selected]
+            self.scene.remove_box_items([box_item for box_item in box_items if box_item])
                 
+        self._schedule_refresh()
+        
+    def _schedule_refresh(self):
+        """Queue one view/status/properties refresh for the end of this event-loop turn"""
+        if self._refresh_pending:
+            return
+        self._refresh_pending = True
+        QTimer.singleShot(0, self._refresh_after_edit)
+        
+    def _refresh_after_edit(self):
+        """Refresh the canvas, status bar and box properties after edits"""
+        self._refresh_pending = False
+        if self.viewer:
+            self.viewer.viewport().update()
         self.update_status()
         self.update_box_properties()
         
+    def on_annotations_changed(self, image_data: ImageData):
+        """Update the annotated count and the image's list row after boxes were added or removed"""
+        if not self.project_manager.update_annotated(image_data):
+            return
+        images = self.project_manager.project.images
+        row = self.project_manager.current_image_index
+        if not (0 <= row < len(images) and images[row] is image_data):
+            row = next((i for i, img in enumerate(images) if img is image_data), -1)
+        if row >= 0:
+            self.image_model.refresh_row(row)
+        
+    def _track_class_use(self, delta: SceneDelta):
+        """Keep the per-class annotation counts in step with a command's changes"""
+        for ann in delta.added:
+            self.project_manager.inc_class_use(ann.class_id)
+        for ann in delta.removed:
+            self.project_manager.dec_class_use(ann.class_id)
+        for old_id, new_id in delta.reclassified:
+            self.project_manager.dec_class_use(old_id)
+            self.project_manager.inc_class_use(new_id)
+        
     def on_class_double_click(self, item: QListWidgetItem):
         """Handle class double click - assign to selected boxes"""
         class_id = item.data(Qt.UserRole)
@@ -496,11 +733,8 @@ class MainWindow(QMainWindow):
         
     def assign_class_by_index(self, index: int):
         """Assign class by index (0-9)"""
-        if not self.project_manager.project:
-            return
-        if 0 <= index < len(self.project_manager.project.classes):
-            class_id = self.project_manager.project.classes[index].id
-            self.assign_class(class_id)
+        if 0 <= index < len(self._classes):
+            self.assign_class(self._classes[index].id)
             
     def assign_class(self, class_id: int):
         """Assign class to selected boxes"""
@@ -523,11 +757,12 @@ class MainWindow(QMainWindow):
             
         # Create command
         cmd = ChangeClassCommand(selected, class_id, cls.name)
-        self.command_history.execute_command(cmd)
+        self._track_class_use(self.command_history.execute_command(cmd))
+        self._mark_edited(self.scene.current_image_data)
         
         # Update scene
         self.scene.update_box_colors()
-        self.update_box_properties()
+        self._schedule_refresh()
         
     def on_class_changed(self, index: int):
         """Handle class combo box change"""
@@ -555,11 +790,11 @@ class MainWindow(QMainWindow):
                 f"x_min: {ann.x_min}, y_min: {ann.y_min}\n"
                 f"x_max: {ann.x_max}, y_max: {ann.y_max}"
             )
-            # Set combo to current class
-            for i in range(self.class_combo.count()):
-                if self.class_combo.itemData(i) == ann.class_id:
-                    self.class_combo.setCurrentIndex(i)
-                    break
+            # Set combo to current class; this only mirrors the selection, so don't reassign it
+            row = self._class_id_to_row.get(ann.class_id)
+            if row is not None:
+                with QSignalBlocker(self.class_combo):
+                    self.class_combo.setCurrentIndex(row)
         else:
             self.box_info_label.setText(f"{len(selected)} boxes selected")
             
@@ -574,6 +809,7 @@ class MainWindow(QMainWindow):
         if not color.isValid():
             return
         class_id = self.project_manager.add_class(name, color.name())
+        self._dirty = True
         self.update_class_list()
         
     def show_class_context_menu(self, pos):
@@ -601,11 +837,24 @@ class MainWindow(QMainWindow):
         name, ok = QInputDialog.getText(self, "Edit Class", "Class name:", text=cls.name)
         if ok and name:
             cls.name = name
-            color = QColorDialog.getColor(QColor(cls.color), self, "Select Color")
+            color = QColorDialog.getColor(_qcolor(cls.color), self, "Select Color")
             if color.isValid():
                 cls.color = color.name()
+            self._dirty = True
+            self.update_class_row(cls)
+            if self.scene:
+                self.scene.update_box_colors(class_id)
+                
+    def update_class_row(self, cls: ClassDefinition):
+        """Update one class's list and combo rows after it was renamed or recolored"""
+        row = self._class_id_to_row.get(cls.id)
+        if row is None:
             self.update_class_list()
-            self.scene.update_box_colors()
+            return
+        item = self.class_list.item(row)
+        item.setText(f"{row}: {cls.name}")
+        item.setForeground(_qcolor(cls.color))
+        self.class_combo.setItemText(row, cls.name)
             
     def delete_selected_class(self):
         """Delete the selected class from the class list"""
@@ -632,14 +881,15 @@ class MainWindow(QMainWindow):
         if not cls_to_delete:
             return
 
-        # Count affected annotations
+        # Count affected annotations; an unused class needs no scan
         affected_images = []
         affected_count = 0
-        for img_data in project.images:
-            anns = [a for a in img_data.annotations if a.class_id == class_id]
-            if anns:
-                affected_images.append((img_data, anns))
-                affected_count += len(anns)
+        if self.project_manager.class_use_count(class_id):
+            for img_data in project.images:
+                anns = [a for a in img_data.annotations if a.class_id == class_id]
+                if anns:
+                    affected_images.append((img_data, anns))
+                    affected_count += len(anns)
 
         if affected_count > 0:
             other_classes = [c for c in project.classes if c.id != class_id]
@@ -679,6 +929,8 @@ class MainWindow(QMainWindow):
                     for img_data, anns in affected_images:
                         for ann in anns:
                             img_data.annotations.remove(ann)
+                    self.project_manager.recount_annotated()
+                    self.image_model.refresh_all()
                     # Reload current image in scene to reflect removals
                     self.set_current_image(self.project_manager.current_image_index)
                 else:
@@ -698,38 +950,73 @@ class MainWindow(QMainWindow):
                 for img_data, anns in affected_images:
                     for ann in anns:
                         img_data.annotations.remove(ann)
+                self.project_manager.recount_annotated()
+                self.image_model.refresh_all()
                 self.set_current_image(self.project_manager.current_image_index)
 
         # Remove class and reindex
+        needs_fixup = bool(affected_count) or any(
+            self.project_manager.class_use_count(c.id) for c in project.classes if c.id > class_id
+        )
         project.classes = [c for c in project.classes if c.id != class_id]
         for i, cls in enumerate(project.classes):
             cls.id = i
+        self.project_manager.rebuild_class_map()
         # Fix any annotation class_ids that shifted due to reindex
-        for img_data in project.images:
-            for ann in img_data.annotations:
-                for cls in project.classes:
-                    if cls.name == ann.class_name:
-                        ann.class_id = cls.id
-                        break
+        if needs_fixup:
+            for img_data in project.images:
+                for ann in img_data.annotations:
+                    for cls in project.classes:
+                        if cls.name == ann.class_name:
+                            ann.class_id = cls.id
+                            break
+            self.project_manager.recount_class_use()
+        self._mark_edited(None)
         self.update_class_list()
         if self.scene:
             self.scene.update_box_colors()
         
     def undo(self):
         """Undo last command"""
-        if self.command_history.undo():
-            # Reload current image to reflect changes
-            self.set_current_image(self.project_manager.current_image_index)
+        delta = self.command_history.undo()
+        if delta is not None:
+            self.apply_scene_delta(delta)
             
     def redo(self):
         """Redo last command"""
-        if self.command_history.redo():
-            # Reload current image to reflect changes
-            self.set_current_image(self.project_manager.current_image_index)
+        delta = self.command_history.redo()
+        if delta is not None:
+            self.apply_scene_delta(delta)
+            
+    def apply_scene_delta(self, delta: SceneDelta):
+        """Patch the scene with the boxes an undo/redo added, removed or changed"""
+        if delta.image_data is not None and not self.project_manager.contains_image(delta.image_data):
+            return  # Not an image of this project; its boxes must not count toward it
+        self._track_class_use(delta)
+        if delta.image_data is not None:
+            self._mark_edited(delta.image_data)
+        elif all(self.scene.box_item_for(ann) for ann in delta.changed):
+            self._mark_edited(self.scene.current_image_data)
+        else:
+            self._mark_edited(None)  # Boxes of an image no longer shown; owner unknown
+        if delta.image_data is not None:
+            self.on_annotations_changed(delta.image_data)
+            if delta.image_data is not self.scene.current_image_data:
+                return  # That image's boxes are not on screen
+        
+        for ann in delta.removed:
+            box_item = self.scene.box_item_for(ann)
+            if box_item:
+                self.scene.remove_box_item(box_item)
+        for ann in delta.added:
+            self.scene.add_box_item(ann)
+        for ann in delta.changed:
+            self.scene.refresh_box_item(ann)
+        self._schedule_refresh()
             
     def save_project(self):
         """Save project"""
-        self.save_current_annotations()
+        self.save_current_annotations(force=True)
         QMessageBox.information(self, "Saved", "Project saved successfully.")
         
     def refresh_project(self):
@@ -751,15 +1038,14 @@ class MainWindow(QMainWindow):
 
         # Sync directory
         new_count, removed_count = self.project_manager.sync_new_images()
+        if new_count or removed_count:
+            self._dirty = True
+        if removed_count:
+            # Commands may refer to images that are no longer in the project
+            self.command_history.clear()
 
         # Rebuild image list
-        self.image_list.clear()
-        for i, img_data in enumerate(self.project_manager.project.images):
-            item = QListWidgetItem(img_data.filename)
-            item.setData(Qt.UserRole, i)
-            if img_data.annotations:
-                item.setText(f"\u2713 {img_data.filename}")
-            self.image_list.addItem(item)
+        self.image_model.reset()
 
         self.update_status()
 
@@ -824,7 +1110,7 @@ class MainWindow(QMainWindow):
         self.status_label.setText(f"Image {current + 1} of {total} | {box_count} boxes")
         
         # Update image count
-        annotated = sum(1 for img in self.project_manager.project.images if img.annotations)
+        annotated = self.project_manager.annotated_count()
         self.image_count_label.setText(f"{total} images, {annotated} annotated")
         
     def show_about(self):
@@ -833,39 +1119,15 @@ class MainWindow(QMainWindow):
         
     def show_shortcuts(self):
         """Show keyboard shortcuts"""
-        shortcuts = """
-Keyboard Shortcuts:
-
-Navigation:
-  ← / → or A / D - Previous/Next image
-  Home / End - First/Last image
-
-Tools:
-  S - Select tool
-  B - Box (draw) tool
-  H - Pan tool
-
-Box Operations:
-  Delete / Backspace - Delete selected box(es)
-  Ctrl+A - Select all boxes
-  Escape - Deselect all
-  1-9, 0 - Assign class by number
-
-Zoom:
-  Ctrl + Mouse Wheel - Zoom in/out
-  Ctrl+0 - Fit to window
-  Ctrl+1 - 100% zoom
-  Ctrl++ / Ctrl+- - Zoom in/out
-
-General:
-  Ctrl+Z - Undo
-  Ctrl+Y - Redo
-  Ctrl+S - Save
-  Ctrl+O - Open folder
-        """
-        QMessageBox.information(self, "Keyboard Shortcuts", shortcuts)
+        QMessageBox.information(self, "Keyboard Shortcuts", _SHORTCUTS_TEXT)
         
     def closeEvent(self, event):
         """Handle close event"""
         self.save_current_annotations()
+        # Finish any export in flight, then run a pending one before the window goes away
+        self._export_pool.waitForDone()
+        if self._export_timer.isActive():
+            self._export_timer.stop()
+            if self.project_manager.project and self.project_manager.project_path:
+                ExportManager.export_all(self.project_manager.project, self.project_manager.project_path)
         event.accept()
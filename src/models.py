@@ -1,11 +1,73 @@
 """Data models for the annotation application"""
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime
-import uuid
-
-
-@dataclass
+from pathlib import Path
+import os
+import sys
+import threading
+
+# dataclass(slots=True) needs Python 3.10+; older interpreters keep a __dict__ per instance
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+def utcnow_iso() -> str:
+    """Current UTC time as an ISO 8601 string with a Z suffix"""
+    return datetime.utcnow().isoformat() + "Z"
+
+
+# Random bytes for new annotation ids, read from the OS a block at a time instead of per id
+_ID_BLOCK_SIZE = 16 * 1024
+_id_lock = threading.Lock()
+_id_bytes = b""
+_id_offset = 0
+
+
+def _new_id() -> str:
+    """Random (version 4) UUID string for a new annotation"""
+    global _id_bytes, _id_offset
+    with _id_lock:
+        if _id_offset >= len(_id_bytes):
+            _id_bytes = os.urandom(_ID_BLOCK_SIZE)
+            _id_offset = 0
+        value = int.from_bytes(_id_bytes[_id_offset:_id_offset + 16], "big")
+        _id_offset += 16
+    # Set the version and variant bits the way uuid.uuid4() does
+    value = value & ~(0xF000 << 64) | (4 << 76)
+    value = value & ~(0xC000 << 48) | (0x8000 << 48)
+    digits = "%032x" % value
+    return f"{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}"
+
+
+def intern_name(name):
+    """Intern a class name so every annotation with that label shares one string"""
+    return sys.intern(name) if isinstance(name, str) else name
+
+
+def clamp_box(x_min: int, y_min: int, x_max: int, y_max: int,
+              img_width: int, img_height: int) -> Tuple[int, int, int, int]:
+    """Clamp box coordinates to image boundaries, keeping at least 1px extent"""
+    # max(low, min(value, high)) per coordinate, spelled as comparisons to skip the builtin calls
+    if x_min > img_width - 1:
+        x_min = img_width - 1
+    if x_min < 0:
+        x_min = 0
+    if y_min > img_height - 1:
+        y_min = img_height - 1
+    if y_min < 0:
+        y_min = 0
+    if x_max > img_width:
+        x_max = img_width
+    if x_max < x_min + 1:
+        x_max = x_min + 1
+    if y_max > img_height:
+        y_max = img_height
+    if y_max < y_min + 1:
+        y_max = y_min + 1
+    return x_min, y_min, x_max, y_max
+
+
+@dataclass(**_SLOTS)
 class ClassDefinition:
     """Class/label definition"""
     id: int
@@ -13,18 +75,22 @@ class ClassDefinition:
     color: str = "#FF0000"
 
 
-@dataclass
+@dataclass(eq=False, **_SLOTS)
 class Annotation:
-    """Bounding box annotation"""
-    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    """Bounding box annotation
+
+    Compared by identity: two boxes with the same coordinates are still
+    different annotations, and list membership/removal stays cheap.
+    """
+    id: str = field(default_factory=_new_id)
     class_id: int = 0
     class_name: str = ""
     x_min: int = 0
     y_min: int = 0
     x_max: int = 0
     y_max: int = 0
-    created_at: str = field(default_factory=lambda: datetime.utcnow().isoformat() + "Z")
-    modified_at: str = field(default_factory=lambda: datetime.utcnow().isoformat() + "Z")
+    created_at: str = field(default_factory=utcnow_iso)
+    modified_at: str = field(default_factory=utcnow_iso)
 
     def to_dict(self):
         return {
@@ -41,31 +107,38 @@ class Annotation:
 
     @classmethod
     def from_dict(cls, data):
+        # The generated defaults (id, timestamps) are only computed for keys that are missing.
+        # Arguments are positional, in field order: this runs once per saved box, and
+        # positional calls skip matching nine keywords
+        get = data.get
         return cls(
-            id=data.get("id", str(uuid.uuid4())),
-            class_id=data.get("class_id", 0),
-            class_name=data.get("class_name", ""),
-            x_min=data.get("x_min", 0),
-            y_min=data.get("y_min", 0),
-            x_max=data.get("x_max", 0),
-            y_max=data.get("y_max", 0),
-            created_at=data.get("created_at", datetime.utcnow().isoformat() + "Z"),
-            modified_at=data.get("modified_at", datetime.utcnow().isoformat() + "Z")
+            data["id"] if "id" in data else _new_id(),
+            get("class_id", 0),
+            intern_name(get("class_name", "")),
+            get("x_min", 0),
+            get("y_min", 0),
+            get("x_max", 0),
+            get("y_max", 0),
+            data["created_at"] if "created_at" in data else utcnow_iso(),
+            data["modified_at"] if "modified_at" in data else utcnow_iso()
         )
 
+    def copy(self) -> "Annotation":
+        """Independent copy of this box, keeping its id and timestamps"""
+        return Annotation(self.id, self.class_id, self.class_name, self.x_min, self.y_min,
+                          self.x_max, self.y_max, self.created_at, self.modified_at)
+
     def clamp_to_bounds(self, img_width: int, img_height: int):
         """Clamp box coordinates to image boundaries"""
-        self.x_min = max(0, min(self.x_min, img_width - 1))
-        self.y_min = max(0, min(self.y_min, img_height - 1))
-        self.x_max = max(self.x_min + 1, min(self.x_max, img_width))
-        self.y_max = max(self.y_min + 1, min(self.y_max, img_height))
+        self.x_min, self.y_min, self.x_max, self.y_max = clamp_box(
+            self.x_min, self.y_min, self.x_max, self.y_max, img_width, img_height)
 
     def is_valid(self) -> bool:
         """Check if annotation has valid dimensions"""
         return self.x_max > self.x_min and self.y_max > self.y_min
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class ImageData:
     """Image metadata and annotations"""
     filename: str
@@ -73,6 +146,20 @@ class ImageData:
     width: int = 0
     height: int = 0
     annotations: List[Annotation] = field(default_factory=list)
+    # filepath as a Path, built on first use; not part of the saved data
+    _path: Optional[Path] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def path(self) -> Path:
+        """The image file's path as a Path object"""
+        if self._path is None:
+            self._path = Path(self.filepath)
+        return self._path
+
+    def copy(self) -> "ImageData":
+        """Copy of this image with copies of its annotations"""
+        return ImageData(self.filename, self.filepath, self.width, self.height,
+                         [ann.copy() for ann in self.annotations])
 
     def to_dict(self):
         return {
@@ -85,25 +172,38 @@ class ImageData:
 
     @classmethod
     def from_dict(cls, data):
+        get = data.get
+        annotation_from_dict = Annotation.from_dict
         return cls(
-            filename=data.get("filename", ""),
-            filepath=data.get("filepath", ""),
-            width=data.get("width", 0),
-            height=data.get("height", 0),
-            annotations=[Annotation.from_dict(ann) for ann in data.get("annotations", [])]
+            filename=get("filename", ""),
+            filepath=get("filepath", ""),
+            width=get("width", 0),
+            height=get("height", 0),
+            annotations=[annotation_from_dict(ann) for ann in get("annotations", [])]
         )
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class Project:
     """Project data model"""
     version: str = "1.0"
-    created_at: str = field(default_factory=lambda: datetime.utcnow().isoformat() + "Z")
-    modified_at: str = field(default_factory=lambda: datetime.utcnow().isoformat() + "Z")
+    created_at: str = field(default_factory=utcnow_iso)
+    modified_at: str = field(default_factory=utcnow_iso)
     image_folder: str = ""
     classes: List[ClassDefinition] = field(default_factory=list)
     images: List[ImageData] = field(default_factory=list)
 
+    def copy(self, images: Optional[List[ImageData]] = None) -> "Project":
+        """Copy of the project that later edits to this one do not affect
+
+        images, if given, are used as the already made copies of this project's images.
+        """
+        if images is None:
+            images = [img.copy() for img in self.images]
+        return Project(self.version, self.created_at, self.modified_at, self.image_folder,
+                       [ClassDefinition(c.id, c.name, c.color) for c in self.classes],
+                       images)
+
     def to_dict(self):
         return {
             "version": self.version,
@@ -116,13 +216,14 @@ class Project:
 
     @classmethod
     def from_dict(cls, data):
-        classes = [ClassDefinition(id=c["id"], name=c["name"], color=c.get("color", "#FF0000"))
+        classes = [ClassDefinition(id=c["id"], name=intern_name(c["name"]), color=c.get("color", "#FF0000"))
                    for c in data.get("classes", [])]
-        images = [ImageData.from_dict(img) for img in data.get("images", [])]
+        image_from_dict = ImageData.from_dict
+        images = [image_from_dict(img) for img in data.get("images", [])]
         return cls(
             version=data.get("version", "1.0"),
-            created_at=data.get("created_at", datetime.utcnow().isoformat() + "Z"),
-            modified_at=data.get("modified_at", datetime.utcnow().isoformat() + "Z"),
+            created_at=data["created_at"] if "created_at" in data else utcnow_iso(),
+            modified_at=data["modified_at"] if "modified_at" in data else utcnow_iso(),
             image_folder=data.get("image_folder", ""),
             classes=classes,
             images=images
@@ -2,13 +2,156 @@
 import json
 import os
 import shutil
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
 from pathlib import Path
-from typing import Optional, List
+from typing import Dict, Optional, List, Set, Tuple
 from PIL import Image
 
-from .models import Project, ImageData, ClassDefinition, Annotation
+from .models import Project, ImageData, ClassDefinition, Annotation, intern_name, utcnow_iso
 from .importers import ImportManager
 
+try:
+    import orjson
+except ImportError:  # Optional; the stdlib json module is used without it
+    orjson = None
+
+
+def _dumps(data) -> bytes:
+    """Serialize project data to indented UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode("utf-8")
+
+
+def _loads(payload: bytes):
+    """Parse project JSON"""
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+# Write buffer for project.json; the streamed image fragments leave in few large writes
+_SAVE_BUFFER_SIZE = 1 << 20
+
+
+def _write_project(f, project: Project):
+    """Write project JSON one image at a time
+
+    The bytes match _dumps(project.to_dict()), but only one image's dict is alive at once.
+    """
+    envelope = _dumps(replace(project, images=[]).to_dict())
+    if not project.images:
+        f.write(envelope)
+        return
+    
+    # "images" is the last key, so the envelope ends with its empty list
+    head, tail = envelope.rsplit(b'[]', 1)
+    f.write(head)
+    f.write(b'[')
+    separator = b'\n    '
+    for img in project.images:
+        f.write(separator)
+        # Indent the image's JSON to its depth inside the list
+        f.write(_dumps(img.to_dict()).replace(b'\n', b'\n    '))
+        separator = b',\n    '
+    f.write(b'\n  ]')
+    f.write(tail)
+
+
+# Small folders are probed serially, since starting the pool is not worth it for a few images.
+# Larger ones use the pool so that slow header reads, such as on network drives, overlap.
+_PARALLEL_PROBE_MIN = 16
+
+
+# JPEG start-of-frame markers, which carry the image size (C4, C8 and CC are not frames)
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _jpeg_size(f) -> Optional[Tuple[int, int]]:
+    """Find the size in a JPEG's start-of-frame segment, skipping the segments before it"""
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        while byte == b'\xff':  # Fill bytes
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            continue  # Markers without a payload
+        if marker in (0xD9, 0xDA):
+            return None  # End of image or start of scan before any frame header
+        length = f.read(2)
+        if len(length) < 2:
+            return None
+        if marker in _JPEG_SOF_MARKERS:
+            frame = f.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack_from('>HH', frame, 1)
+            return width, height
+        f.seek(struct.unpack('>H', length)[0] - 2, os.SEEK_CUR)
+
+
+def _sniff_size(path: Path) -> Optional[Tuple[int, int]]:
+    """Read the size of a PNG, JPEG, BMP or WebP image straight from its header
+
+    Returns None for other formats and unexpected headers, which are left to PIL.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(30)
+        if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+            return struct.unpack_from('>II', head, 16)
+        if head[:2] == b'\xff\xd8':
+            return _jpeg_size(f)
+        if head[:2] == b'BM' and len(head) >= 26:
+            if struct.unpack_from('<I', head, 14)[0] == 12:  # OS/2 1.x header
+                return struct.unpack_from('<HH', head, 18)
+            width, height = struct.unpack_from('<ii', head, 18)
+            return width, abs(height)  # Negative height means top-down rows
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP' and len(head) >= 30:
+            chunk = head[12:16]
+            if chunk == b'VP8 ' and head[23:26] == b'\x9d\x01\x2a':
+                width, height = struct.unpack_from('<HH', head, 26)
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b'VP8L' and head[20] == 0x2F:
+                bits = int.from_bytes(head[21:25], 'little')
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b'VP8X':
+                return int.from_bytes(head[24:27], 'little') + 1, int.from_bytes(head[27:30], 'little') + 1
+    return None
+
+
+def _image_size(path: Path) -> Optional[Tuple[int, int]]:
+    """Read an image's size from its header, or None if it can't be opened"""
+    # Common formats are read directly; PIL's plugin machinery handles the rest
+    try:
+        size = _sniff_size(path)
+        if size is not None:
+            return size
+    except (OSError, struct.error):
+        pass
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def _probe_images(paths: List[Path]) -> List[Tuple[Path, Tuple[int, int]]]:
+    """Get (path, size) for the readable images among paths, in order"""
+    # Header reads are I/O bound, so they overlap well across threads
+    if len(paths) >= _PARALLEL_PROBE_MIN:
+        with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+            sizes = list(executor.map(_image_size, paths))
+    else:
+        sizes = [_image_size(path) for path in paths]
+    return [(path, size) for path, size in zip(paths, sizes) if size is not None]
+
 
 class ProjectManager:
     """Manages project state, loading, and saving"""
@@ -17,6 +160,12 @@ class ProjectManager:
         self.project: Optional[Project] = None
         self.project_path: Optional[Path] = None
         self.current_image_index: int = -1
+        # Class id -> definition; rebuilt whenever the class list is replaced or reindexed
+        self._class_by_id: Dict[int, ClassDefinition] = {}
+        # Identities of images that have annotations; kept current so status updates don't rescan
+        self._annotated_images: Set[int] = set()
+        # Class id -> number of annotations using it, so deleting an unused class skips the scan
+        self._class_use_count: Dict[int, int] = {}
         
     def create_project(self, image_folder: str, project_path: Optional[str] = None) -> bool:
         """Create a new project from an image folder"""
@@ -42,26 +191,24 @@ class ProjectManager:
             classes=[ClassDefinition(id=0, name="object", color="#FF0000")]
         )
         
-        # Add images
-        for img_path in image_files:
-            try:
-                with Image.open(img_path) as img:
-                    width, height = img.size
-                image_data = ImageData(
-                    filename=img_path.name,
-                    filepath=str(img_path.absolute()),
-                    width=width,
-                    height=height
-                )
-                self.project.images.append(image_data)
-            except Exception:
-                continue  # Skip invalid images
+        # Add images (invalid images are skipped)
+        for img_path, (width, height) in _probe_images(image_files):
+            image_data = ImageData(
+                filename=img_path.name,
+                filepath=str(img_path.absolute()),
+                width=width,
+                height=height
+            )
+            self.project.images.append(image_data)
                 
         self.current_image_index = 0 if self.project.images else -1
         
         # Try to import existing annotations from exports folder
         if self.project_path:
             ImportManager.import_existing_annotations(self.project, self.project_path)
+        self.rebuild_class_map()
+        self.recount_annotated()
+        self.recount_class_use()
         
         return True
         
@@ -72,14 +219,17 @@ class ProjectManager:
             return False
             
         try:
-            with open(project_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(project_file, 'rb') as f:
+                data = _loads(f.read())
             self.project = Project.from_dict(data)
             self.project_path = project_file
             self.current_image_index = 0 if self.project.images else -1
             
             # Try to import existing annotations from exports folder
             ImportManager.import_existing_annotations(self.project, self.project_path)
+            self.rebuild_class_map()
+            self.recount_annotated()
+            self.recount_class_use()
             
             return True
         except Exception:
@@ -87,14 +237,17 @@ class ProjectManager:
             backup_file = project_file.with_suffix('.json.bak')
             if backup_file.exists():
                 try:
-                    with open(backup_file, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
+                    with open(backup_file, 'rb') as f:
+                        data = _loads(f.read())
                     self.project = Project.from_dict(data)
                     self.project_path = project_file
                     self.current_image_index = 0 if self.project.images else -1
                     
                     # Try to import existing annotations from exports folder
                     ImportManager.import_existing_annotations(self.project, self.project_path)
+                    self.rebuild_class_map()
+                    self.recount_annotated()
+                    self.recount_class_use()
                     
                     return True
                 except Exception:
@@ -107,27 +260,26 @@ class ProjectManager:
             return False
             
         try:
-            # Create backup
-            if self.project_path.exists():
-                backup_path = self.project_path.with_suffix('.json.bak')
-                shutil.copy2(self.project_path, backup_path)
-            
             # Update modified timestamp
-            from datetime import datetime
-            self.project.modified_at = datetime.utcnow().isoformat() + "Z"
+            self.project.modified_at = utcnow_iso()
             
             # Write to temp file
             temp_path = self.project_path.with_suffix('.json.tmp')
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                json.dump(self.project.to_dict(), f, indent=2)
+            with open(temp_path, 'wb', buffering=_SAVE_BUFFER_SIZE) as f:
+                _write_project(f, self.project)
+            
+            # Keep the previous version as the backup; a hard link costs nothing however
+            # large the project is, and a copy is the fallback where links aren't supported
+            if self.project_path.exists():
+                backup_path = self.project_path.with_suffix('.json.bak')
+                try:
+                    backup_path.unlink(missing_ok=True)
+                    os.link(self.project_path, backup_path)
+                except OSError:
+                    shutil.copy2(self.project_path, backup_path)
             
-            # Atomic rename
-            if os.name == 'nt':  # Windows
-                if self.project_path.exists():
-                    os.remove(self.project_path)
-                os.rename(temp_path, self.project_path)
-            else:  # Unix-like
-                os.replace(temp_path, self.project_path)
+            # Atomic rename (os.replace is atomic on Windows too)
+            os.replace(temp_path, self.project_path)
                 
             return True
         except Exception as e:
@@ -148,11 +300,16 @@ class ProjectManager:
         if not folder_path.exists():
             return (0, 0)
 
+        # One directory listing tells which images still exist and which are new
+        image_files = self._find_image_files(folder_path)
+        live_paths = {img_path.name: str(img_path.absolute()) for img_path in image_files}
+
         # --- Remove deleted images ---
         before_count = len(self.project.images)
         self.project.images = [
             img for img in self.project.images
-            if Path(img.filepath).exists()
+            # Only images recorded under some other path need their own stat
+            if live_paths.get(img.filename) == img.filepath or img.path.exists()
         ]
         removed_count = before_count - len(self.project.images)
 
@@ -162,25 +319,21 @@ class ProjectManager:
 
         # --- Add new images ---
         existing_filenames = {img.filename for img in self.project.images}
-        image_files = self._find_image_files(folder_path)
+        new_files = [img_path for img_path in image_files if img_path.name not in existing_filenames]
 
         new_count = 0
-        for img_path in image_files:
-            if img_path.name not in existing_filenames:
-                try:
-                    with Image.open(img_path) as img:
-                        width, height = img.size
-                    image_data = ImageData(
-                        filename=img_path.name,
-                        filepath=str(img_path.absolute()),
-                        width=width,
-                        height=height
-                    )
-                    self.project.images.append(image_data)
-                    new_count += 1
-                except Exception:
-                    continue
+        for img_path, (width, height) in _probe_images(new_files):
+            image_data = ImageData(
+                filename=img_path.name,
+                filepath=str(img_path.absolute()),
+                width=width,
+                height=height
+            )
+            self.project.images.append(image_data)
+            new_count += 1
 
+        self.recount_annotated()
+        self.recount_class_use()
         return (new_count, removed_count)
 
     def get_current_image(self) -> Optional[ImageData]:
@@ -205,23 +358,96 @@ class ProjectManager:
         if not self.project:
             return -1
         class_id = len(self.project.classes)
-        self.project.classes.append(ClassDefinition(id=class_id, name=name, color=color))
+        cls = ClassDefinition(id=class_id, name=intern_name(name), color=color)
+        self.project.classes.append(cls)
+        self._class_by_id[class_id] = cls
         return class_id
         
     def get_class(self, class_id: int) -> Optional[ClassDefinition]:
         """Get class definition by ID"""
         if not self.project:
             return None
-        for cls in self.project.classes:
-            if cls.id == class_id:
-                return cls
-        return None
+        return self._class_by_id.get(class_id)
+        
+    def class_color_for(self, class_id: int) -> Optional[str]:
+        """Get the color of a class by ID, or None if there is no such class"""
+        cls = self.get_class(class_id)
+        return cls.color if cls else None
+        
+    def rebuild_class_map(self):
+        """Rebuild the class ID lookup after the class list is replaced or reindexed"""
+        if self.project:
+            self._class_by_id = {cls.id: cls for cls in self.project.classes}
+        else:
+            self._class_by_id = {}
+        
+    def recount_annotated(self):
+        """Rebuild the set of annotated images after annotations were loaded or bulk-edited"""
+        if self.project:
+            self._annotated_images = {id(img) for img in self.project.images if img.annotations}
+        else:
+            self._annotated_images = set()
+        
+    def contains_image(self, image_data: ImageData) -> bool:
+        """Whether image_data is one of the current project's images (not a copy or a stale one)"""
+        if not self.project:
+            return False
+        images = self.project.images
+        # Edits almost always concern the current image
+        if 0 <= self.current_image_index < len(images) and images[self.current_image_index] is image_data:
+            return True
+        return any(img is image_data for img in images)
+        
+    def update_annotated(self, image_data: ImageData) -> bool:
+        """Record whether one image has annotations; returns True if that changed"""
+        # Images from a previous project or removed by a sync must not enter the set
+        if not self.contains_image(image_data):
+            return False
+        key = id(image_data)
+        was_annotated = key in self._annotated_images
+        if image_data.annotations:
+            self._annotated_images.add(key)
+        else:
+            self._annotated_images.discard(key)
+        return was_annotated != bool(image_data.annotations)
+        
+    def annotated_count(self) -> int:
+        """Number of images with at least one annotation"""
+        return len(self._annotated_images)
+        
+    def recount_class_use(self):
+        """Rebuild the per-class annotation counts after annotations were loaded or bulk-edited"""
+        counts: Dict[int, int] = {}
+        if self.project:
+            for img in self.project.images:
+                for ann in img.annotations:
+                    counts[ann.class_id] = counts.get(ann.class_id, 0) + 1
+        self._class_use_count = counts
+        
+    def inc_class_use(self, class_id: int):
+        """Count one more annotation using a class"""
+        self._class_use_count[class_id] = self._class_use_count.get(class_id, 0) + 1
+        
+    def dec_class_use(self, class_id: int):
+        """Count one less annotation using a class"""
+        count = self._class_use_count.get(class_id, 0) - 1
+        if count > 0:
+            self._class_use_count[class_id] = count
+        else:
+            self._class_use_count.pop(class_id, None)
+        
+    def class_use_count(self, class_id: int) -> int:
+        """Number of annotations using a class"""
+        return self._class_use_count.get(class_id, 0)
         
     def _find_image_files(self, folder: Path) -> List[Path]:
         """Find all image files in folder"""
         extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.webp'}
-        image_files = []
-        for ext in extensions:
-            image_files.extend(folder.glob(f'*{ext}'))
-            image_files.extend(folder.glob(f'*{ext.upper()}'))
-        return sorted(image_files)
+        # One directory scan, matching extensions in any letter case
+        with os.scandir(folder) as entries:
+            names = sorted(
+                entry.name for entry in entries
+                if os.path.splitext(entry.name)[1].lower() in extensions
+                and entry.is_file()
+            )
+        return [folder / name for name in names]